@@ -3,13 +3,30 @@ import random
 
 
 class AVLTreeNode(BinaryTreeNode):
+    __slots__ = ("height",)
 
     def __init__(self, data):
         self.height = 0
         super().__init__(data)
 
+    # calc_height() and balance run on every node of every insert and
+    # remove path, so they read the children directly instead of building
+    # the child_heights tuple.
     def calc_height(self):
-        self.height = max(self.child_heights) + 1
+        left = self.left_child
+        right = self.right_child
+        left_height = left.height if left is not None else -1
+        right_height = right.height if right is not None else -1
+        self.height = (left_height if left_height > right_height
+                       else right_height) + 1
+
+    # Left subtree height minus right subtree height.
+    @property
+    def balance(self):
+        left = self.left_child
+        right = self.right_child
+        return ((left.height if left is not None else -1)
+                - (right.height if right is not None else -1))
 
     @property
     def child_heights(self):
@@ -51,41 +68,46 @@ class AVLTree(BinarySearchTree):
         new_sub_root.calc_height()
         return new_sub_root
 
-    def _insert(self, data, sub_root):
-        if sub_root is None:
-            self._size += 1
-            return AVLTreeNode(data)
-        sub_root = super()._insert(data, sub_root)
-        sub_root = self._rotate_if_needed(sub_root)
-        return sub_root
+    def _new_node(self, data):
+        return AVLTreeNode(data)
 
-    def _remove(self, data, sub_root):
-        sub_root = super()._remove(data, sub_root)
-        sub_root = self._rotate_if_needed(sub_root)
-        return sub_root
+    def _build_balanced(self, items, low, high):
+        node = super()._build_balanced(items, low, high)
+        if node is not None:
+            node.calc_height()
+        return node
+
+    # Walks back up the insert/remove path recomputing heights and rotating
+    # where needed.  Once a node comes back unrotated with its old height the
+    # balance of everything above it is unchanged, so the walk stops there.
+    def _retrace(self, path):
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            old_height = node.height
+            new_node = self._rotate_if_needed(node)
+            if new_node is node:
+                if node.height == old_height:
+                    return
+            else:
+                self._replace_child(path[i - 1] if i > 0 else None,
+                                    node, new_node)
 
     def _rotate_if_needed(self, node):
         if node is None:
             return node
         node.calc_height()
-        (left_height, right_height) = node.child_heights
-        if left_height - right_height > 1:
+        balance = node.balance
+        if balance > 1:
             # Right Rotation Needed
-            if node.left_child is not None:
-                (left_height, right_height) = \
-                    node.left_child.child_heights
-                if right_height - left_height > 0:
-                    # Left Right Rotation Needed
-                    node.left_child = self.left_rotation(node.left_child)
+            if node.left_child is not None and node.left_child.balance < 0:
+                # Left Right Rotation Needed
+                node.left_child = self.left_rotation(node.left_child)
             node = self.right_rotation(node)
-        elif right_height - left_height > 1:
+        elif balance < -1:
             # Right Rotation Needed
-            if node.right_child is not None:
-                (left_height, right_height) = \
-                    node.right_child.child_heights
-                if left_height - right_height > 0:
-                    # Right Left Rotation Needed
-                    node.right_child = self.right_rotation(node.right_child)
+            if node.right_child is not None and node.right_child.balance > 0:
+                # Right Left Rotation Needed
+                node.right_child = self.right_rotation(node.right_child)
             node = self.left_rotation(node)
         return node
 
@@ -1,4 +1,12 @@
+from bisect import bisect_left
+
+# Default for get() calls that need to tell a miss from any stored value.
+_MISSING = object()
+
+
 class BinaryTreeNode:
+    # Slotted, as there is one node per stored keyword.
+    __slots__ = ("data", "left_child", "right_child")
 
     def __init__(self, data):
         self.data = data
@@ -18,66 +26,181 @@ class BinarySearchTree:
         self._root = None
         self._size = 0
 
+    # Builds a perfectly balanced tree from items that are already in
+    # strictly increasing order, in O(n) and without any comparisons beyond
+    # the order check.
+    @classmethod
+    def from_sorted(cls, items):
+        items = list(items)
+        for i in range(1, len(items)):
+            if not items[i - 1] < items[i]:
+                raise ValueError("from_sorted() needs strictly increasing items")
+        tree = cls()
+        tree._root = tree._build_balanced(items, 0, len(items))
+        tree._size = len(items)
+        return tree
+
+    def _build_balanced(self, items, low, high):
+        if low >= high:
+            return None
+        mid = (low + high) // 2
+        node = self._new_node(items[mid])
+        node.left_child = self._build_balanced(items, low, mid)
+        node.right_child = self._build_balanced(items, mid + 1, high)
+        return node
+
     @property
     def size(self):
         return self._size
 
     def find(self, key: str):
-        return self._find(key.upper(), self._root)
-
-    def _find(self, key, sub_root):
-        if sub_root is None:
+        data = self.get(key, _MISSING)
+        if data is _MISSING:
             raise BinarySearchTree.NotFoundError
-        if key < sub_root.data:
-            return self._find(key, sub_root.left_child)
-        elif sub_root.data < key:
-            return self._find(key, sub_root.right_child)
-        else:
-            return sub_root.data
+        return data
+
+    # find() without the exception: default is returned on a miss.
+    def get(self, key, default=None):
+        if type(key) is str:
+            key = key.upper()
+        sub_root = self._root
+        while sub_root is not None:
+            if key < sub_root.data:
+                sub_root = sub_root.left_child
+            elif sub_root.data < key:
+                sub_root = sub_root.right_child
+            else:
+                return sub_root.data
+        return default
+
+    # Looks up a whole batch of keys in one walk.  The sorted keys are split
+    # around every node they reach, so keys that share a path share its
+    # descent and each node is compared against at most once per batch.
+    # Returns a dict mapping each key that was found to its data.
+    def find_many(self, keys):
+        keys = sorted({key.upper() for key in keys})
+        found = {}
+        stack = [(self._root, 0, len(keys))]
+        while stack:
+            sub_root, low, high = stack.pop()
+            if sub_root is None or low == high:
+                continue
+            split = bisect_left(keys, sub_root.data, low, high)
+            if split < high and keys[split] == sub_root.data:
+                found[keys[split]] = sub_root.data
+                stack.append((sub_root.right_child, split + 1, high))
+            else:
+                stack.append((sub_root.right_child, split, high))
+            stack.append((sub_root.left_child, low, split))
+        return found
+
+    # Lazily yields the data of every node with low <= data < high, in
+    # order; either bound may be None.  The walk goes straight down to the
+    # first node in range and keeps only the path back up on its stack, so
+    # the first k items cost O(log n + k) on a balanced tree.
+    def range(self, low=None, high=None):
+        if type(low) is str:
+            low = low.upper()
+        if type(high) is str:
+            high = high.upper()
+        stack = []
+        sub_root = self._root
+        while sub_root is not None:
+            if low is not None and sub_root.data < low:
+                sub_root = sub_root.right_child
+            else:
+                stack.append(sub_root)
+                sub_root = sub_root.left_child
+        while stack:
+            node = stack.pop()
+            if high is not None and not node.data < high:
+                return
+            yield node.data
+            sub_root = node.right_child
+            while sub_root is not None:
+                stack.append(sub_root)
+                sub_root = sub_root.left_child
+
+    # Every key starting with prefix, in order: the range from prefix up to
+    # the first string past all of its extensions.
+    def prefix(self, prefix):
+        prefix = prefix.upper()
+        if not prefix:
+            return self.range()
+        return self.range(prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
 
     def __contains__(self, key):
-        try:
-            self.find(key)
-            return True
-        except self.NotFoundError:
-            return False
+        return self.get(key, _MISSING) is not _MISSING
 
-    def insert(self, data):
-        old_size = self._size
-        self._root = self._insert(data, self._root)
-        return old_size != self._size
+    # insert() and remove() walk down iteratively and record the path they
+    # took, root first.  Subclasses that need to fix the tree up on the way
+    # back (AVLTree) override _new_node() and _retrace().
+    def _new_node(self, data):
+        return BinaryTreeNode(data)
 
-    def _insert(self, data, sub_root):
-        if sub_root is None:
-            self._size += 1
-            return BinaryTreeNode(data)
-        if data < sub_root.data:
-            sub_root.left_child = self._insert(data, sub_root.left_child)
-        elif sub_root.data < data:
-            sub_root.right_child = self._insert(data, sub_root.right_child)
-        return sub_root
+    def _retrace(self, path):
+        pass
 
-    def remove(self, data):
-        self._root = self._remove(data, self._root)
+    def _replace_child(self, parent, old_child, new_child):
+        if parent is None:
+            self._root = new_child
+        elif parent.left_child is old_child:
+            parent.left_child = new_child
+        else:
+            parent.right_child = new_child
 
-    def _remove(self, data, sub_root):
+    def insert(self, data):
+        path = []
+        sub_root = self._root
+        while sub_root is not None:
+            path.append(sub_root)
+            if data < sub_root.data:
+                sub_root = sub_root.left_child
+            elif sub_root.data < data:
+                sub_root = sub_root.right_child
+            else:
+                return False
+        node = self._new_node(data)
+        if not path:
+            self._root = node
+        elif data < path[-1].data:
+            path[-1].left_child = node
+        else:
+            path[-1].right_child = node
+        self._size += 1
+        self._retrace(path)
+        return True
+
+    def remove(self, data):
+        path = []
+        sub_root = self._root
+        while sub_root is not None:
+            if data < sub_root.data:
+                path.append(sub_root)
+                sub_root = sub_root.left_child
+            elif sub_root.data < data:
+                path.append(sub_root)
+                sub_root = sub_root.right_child
+            else:
+                break
         if sub_root is None:
             raise BinarySearchTree.NotFoundError
-        if data < sub_root.data:
-            sub_root.left_child = self._remove(data, sub_root.left_child)
-        elif sub_root.data < data:
-            sub_root.right_child = self._remove(data, sub_root.right_child)
-
-        elif sub_root.left_child is not None \
+        if sub_root.left_child is not None \
                 and sub_root.right_child is not None:
-            sub_root.data = self._find_min(sub_root.right_child)
-            sub_root.right_child = \
-                self._remove(sub_root.data, sub_root.right_child)
-        else:
-            sub_root = sub_root.left_child if sub_root.left_child is not None \
-                else sub_root.right_child
-            self._size -= 1
-        return sub_root
+            # Pull the smallest node of the right subtree up into sub_root
+            # and unlink that node instead; it has no left child.
+            path.append(sub_root)
+            successor = sub_root.right_child
+            while successor.left_child is not None:
+                path.append(successor)
+                successor = successor.left_child
+            sub_root.data = successor.data
+            sub_root = successor
+        child = sub_root.left_child if sub_root.left_child is not None \
+            else sub_root.right_child
+        self._replace_child(path[-1] if path else None, sub_root, child)
+        self._size -= 1
+        self._retrace(path)
 
     def find_min(self):
         if self._root is None:
@@ -85,10 +208,9 @@ class BinarySearchTree:
         return self._find_min(self._root)
 
     def _find_min(self, sub_root):
-        if sub_root.left_child is None:
-            return sub_root.data
-        else:
-            return self._find_min(sub_root.left_child)
+        while sub_root.left_child is not None:
+            sub_root = sub_root.left_child
+        return sub_root.data
 
     def find_max(self):
         if self._root is None:
@@ -96,19 +218,20 @@ class BinarySearchTree:
         return self._find_max(self._root)
 
     def _find_max(self, sub_root):
-        if sub_root.right_child is None:
-            return sub_root.data
-        else:
-            return self._find_max(sub_root.right_child)
+        while sub_root.right_child is not None:
+            sub_root = sub_root.right_child
+        return sub_root.data
 
     def traverse(self, function):
         self._traverse(function, self._root)
 
     def _traverse(self, function, sub_root):
-        if sub_root is None:
-            return
-        if sub_root.left_child is not None:
-            self._traverse(function, sub_root.left_child)
-        function(sub_root)
-        if sub_root.right_child is not None:
-            self._traverse(function, sub_root.right_child)
+        stack = []
+        while stack or sub_root is not None:
+            if sub_root is not None:
+                stack.append(sub_root)
+                sub_root = sub_root.left_child
+            else:
+                sub_root = stack.pop()
+                function(sub_root)
+                sub_root = sub_root.right_child
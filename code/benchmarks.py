@@ -0,0 +1,806 @@
+import functools
+import gc
+import glob
+import os
+import random
+import string
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from main import KeywordEntry, WebStore
+from BST import BinarySearchTree
+from AVL_tree import AVLTree, AVLTreeNode
+from hash_table import HashQP, CompactHashQP, HASH_FUNCTIONS
+from postings import DocumentTable
+from fetcher import Fetcher
+from crawler import parse_page, TOKENIZERS
+from sharded_store import ShardedWebStore
+from concurrent_store import ConcurrentWebStore
+from splay_tree import SplayTree
+
+
+def _vocabulary(size, seed=0):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(string.ascii_uppercase,
+                                      k=rng.randint(4, 10))))
+    return sorted(words)
+
+
+# Pages of Zipf-distributed words, so a few keywords appear everywhere and
+# most appear on a handful of pages, roughly like a real crawl.
+def synthetic_pages(num_pages, words_per_page, vocabulary_size, seed=0):
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(vocabulary_size, seed)
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    return [(f"http://example.com/page{page}.html",
+             rng.choices(vocabulary, weights, k=words_per_page))
+            for page in range(num_pages)]
+
+
+def _measure(build):
+    tracemalloc.start()
+    result = build()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used, result
+
+
+class _DictKeywordEntry:
+    # KeywordEntry's original layout, kept here as the baseline: a dict from
+    # every url to a list of int positions.
+
+    def __init__(self, word, url, location):
+        self._word = word
+        self._sites = {url: [location]}
+
+    def add(self, url, location):
+        if url in self._sites:
+            self._sites[url].append(location)
+        else:
+            self._sites[url] = [location]
+
+
+def bench_postings_memory(num_pages=500, words_per_page=500,
+                          vocabulary_size=5000):
+    pages = synthetic_pages(num_pages, words_per_page, vocabulary_size)
+    num_postings = num_pages * words_per_page
+
+    def build(entry_class, *args):
+        entries = {}
+        for url, words in pages:
+            for n, word in enumerate(words):
+                if word in entries:
+                    entries[word].add(url, n)
+                else:
+                    entries[word] = entry_class(word, url, n, *args)
+        return entries
+
+    print(f"Postings memory: {num_pages} pages x {words_per_page} words, "
+          f"{vocabulary_size} word vocabulary")
+    before, _ = _measure(lambda: build(_DictKeywordEntry))
+    after, _ = _measure(lambda: build(KeywordEntry, DocumentTable()))
+    print(f"-- dict of lists: {before / num_postings:6.2f} bytes per posting")
+    print(f"-- compact:       {after / num_postings:6.2f} bytes per posting")
+
+
+def _build_store(ds, pages):
+    store = WebStore(ds)
+    for url, words in pages:
+        store._add_page(url, words)
+    return store
+
+
+def bench_boolean_queries(num_pages=2000, words_per_page=500,
+                          vocabulary_size=5000, trials=100):
+    pages = synthetic_pages(num_pages, words_per_page, vocabulary_size)
+    store = _build_store(HashQP, pages)
+    vocabulary = _vocabulary(vocabulary_size)
+    # Words are Zipf-weighted by their rank in the sorted vocabulary, so
+    # rarity follows the position (50 and 2000 of the default 5000).
+    common = vocabulary[0]
+    middling = vocabulary[len(vocabulary) // 100]
+    rare = vocabulary[len(vocabulary) * 2 // 5]
+    _, words = pages[0]
+    phrase = " ".join(words[10:13])
+    print(f"Boolean queries: {num_pages * words_per_page} postings")
+    for text in (f"{common} {middling}", f"{common} {rare}",
+                 f"{middling} OR {rare}", f"{common} NOT {middling}",
+                 f'"{phrase}"'):
+        time_us = timeit.timeit(lambda: store.query(text),
+                                number=trials) / trials * (10 ** 6)
+        print(f"-- {time_us:9.2f} microseconds for {text}")
+
+
+class _RecursiveOps:
+    # The recursive find/insert/remove the trees used before they were made
+    # iterative, kept as the baseline for bench_tree_operations().
+
+    def find(self, key):
+        return self._find_r(key.upper(), self._root)
+
+    def _find_r(self, key, sub_root):
+        if sub_root is None:
+            raise BinarySearchTree.NotFoundError
+        if key < sub_root.data:
+            return self._find_r(key, sub_root.left_child)
+        elif sub_root.data < key:
+            return self._find_r(key, sub_root.right_child)
+        return sub_root.data
+
+    def insert(self, data):
+        old_size = self._size
+        self._root = self._insert_r(data, self._root)
+        return old_size != self._size
+
+    def _insert_r(self, data, sub_root):
+        if sub_root is None:
+            self._size += 1
+            return self._new_node(data)
+        if data < sub_root.data:
+            sub_root.left_child = self._insert_r(data, sub_root.left_child)
+        elif sub_root.data < data:
+            sub_root.right_child = self._insert_r(data, sub_root.right_child)
+        return self._balance(sub_root)
+
+    def remove(self, data):
+        self._root = self._remove_r(data, self._root)
+
+    def _remove_r(self, data, sub_root):
+        if sub_root is None:
+            raise BinarySearchTree.NotFoundError
+        if data < sub_root.data:
+            sub_root.left_child = self._remove_r(data, sub_root.left_child)
+        elif sub_root.data < data:
+            sub_root.right_child = self._remove_r(data, sub_root.right_child)
+        elif sub_root.left_child is not None \
+                and sub_root.right_child is not None:
+            sub_root.data = self._find_min(sub_root.right_child)
+            sub_root.right_child = \
+                self._remove_r(sub_root.data, sub_root.right_child)
+        else:
+            sub_root = sub_root.left_child if sub_root.left_child is not None \
+                else sub_root.right_child
+            self._size -= 1
+        return self._balance(sub_root)
+
+
+class _RecursiveBinarySearchTree(_RecursiveOps, BinarySearchTree):
+
+    def _balance(self, sub_root):
+        return sub_root
+
+
+class _RecursiveAVLTree(_RecursiveOps, AVLTree):
+
+    def _balance(self, sub_root):
+        return self._rotate_if_needed(sub_root)
+
+
+def _time_per_op(function, items):
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    return (time.perf_counter() - start) / len(items) * (10 ** 6)
+
+
+def bench_tree_operations(sizes=(10_000, 100_000, 1_000_000)):
+    print("Tree operations: recursive vs iterative, random keys")
+    for size in sizes:
+        rng = random.Random(size)
+        keys = list({"".join(rng.choices(string.ascii_uppercase, k=12))
+                     for _ in range(size)})
+        lookups = rng.sample(keys, min(size, 100_000))
+        removals = rng.sample(keys, min(size // 10, 10_000))
+        print(f"- {len(keys)} keys")
+        for old, new in ((_RecursiveBinarySearchTree, BinarySearchTree),
+                         (_RecursiveAVLTree, AVLTree)):
+            times = []
+            for tree in (old(), new()):
+                times.append((_time_per_op(tree.insert, keys),
+                              _time_per_op(tree.find, lookups),
+                              _time_per_op(tree.remove, removals)))
+            for op, before, after in zip(("insert", "find", "remove"),
+                                         times[0], times[1]):
+                print(f"-- {new.__name__:16} {op:6}: {before:5.2f} -> "
+                      f"{after:5.2f} microseconds ({before / after:.2f}x)")
+
+
+def _random_keys(count, seed):
+    rng = random.Random(seed)
+    keys = set()
+    while len(keys) < count:
+        keys.add("".join(rng.choices(string.ascii_uppercase, k=10)))
+    return list(keys)
+
+
+def bench_hash_layout(size=100_000, lookups=100_000):
+    keys = _random_keys(2 * size, size)
+    stored, missing = keys[:size], keys[size:size + lookups]
+    entries = [KeywordEntry(key) for key in stored]
+    rng = random.Random(0)
+    hits = rng.choices(stored, k=lookups)
+    print(f"Hash table layout: {size} keywords")
+    for table_class in (HashQP, CompactHashQP):
+        def build():
+            table = table_class()
+            for entry in entries:
+                table.insert(entry)
+            return table
+        used, table = _measure(build)
+        print(f"- {table_class.__name__}: {used / size:6.1f} bytes per keyword "
+              f"({table._table_size} buckets)")
+        for name, keys in (("hit", hits), ("miss", missing)):
+            print(f"-- {name:4}: {_time_per_op(table.__contains__, keys):5.2f} "
+                  f"microseconds per lookup")
+
+
+# For each hash strategy: throughput of the function itself, the fraction of
+# keys whose home bucket is already taken in a table sized the way HashQP
+# would size it, and the cost of filling a HashQP with it.  The builtin hash
+# is cached on each str, so its throughput is measured on fresh copies.
+def bench_hash_functions(size=50_000):
+    key_sets = (("random", _random_keys(size, 1)),
+                ("sequential", [f"PAGE{n:08d}" for n in range(size)]))
+    table_size = HashQP()._next_prime(2 * size)
+    print(f"Hash functions: {size} keys, {table_size} buckets")
+    for name, keys in key_sets:
+        print(f"- {name} keys")
+        entries = [KeywordEntry(key) for key in keys]
+        for strategy, hash_function in HASH_FUNCTIONS.items():
+            fresh = ["".join(key) for key in keys]
+            start = time.perf_counter()
+            for key in fresh:
+                hash_function(key)
+            rate = len(keys) / (time.perf_counter() - start)
+            buckets = set()
+            collisions = 0
+            for key in keys:
+                bucket = hash_function(key) % table_size
+                if bucket in buckets:
+                    collisions += 1
+                buckets.add(bucket)
+            table = HashQP(hash_function=strategy)
+            insert_us = _time_per_op(table.insert, entries)
+            print(f"-- {strategy:10}: {rate / 10 ** 6:6.2f}M hashes/s, "
+                  f"{collisions / len(keys) * 100:5.2f}% collisions, "
+                  f"{insert_us:5.2f} microseconds per insert")
+
+
+# The garbage collector is switched off while timing, otherwise its full
+# collections (triggered by the KeywordEntry allocations, not the table)
+# dominate the worst case.
+def bench_insert_latency(size=500_000):
+    entries = [KeywordEntry(key) for key in _random_keys(size, 7)]
+    print(f"Insert latency: {size} inserts into an empty table")
+    gc.disable()
+    for name, make in (("HashQP", HashQP),
+                       ("HashQP incremental",
+                        lambda: HashQP(incremental_rehash=True)),
+                       ("CompactHashQP", CompactHashQP)):
+        table = make()
+        latencies = []
+        for entry in entries:
+            start = time.perf_counter_ns()
+            table.insert(entry)
+            latencies.append(time.perf_counter_ns() - start)
+        latencies.sort()
+        mean = sum(latencies) / len(latencies) / 1000
+        p999 = latencies[int(len(latencies) * .999)] / 1000
+        print(f"-- {name:18}: mean {mean:6.2f}, 99.9% {p999:8.2f}, "
+              f"worst {latencies[-1] / 1000:10.2f} microseconds")
+    gc.enable()
+
+
+# Rebuilding from pages is what a restart cost before indexes could be saved.
+def bench_index_file(num_pages=2000, words_per_page=500, vocabulary_size=5000):
+    pages = synthetic_pages(num_pages, words_per_page, vocabulary_size)
+    vocabulary = _vocabulary(vocabulary_size)
+    print(f"Index file: {num_pages * words_per_page} postings")
+    start = time.perf_counter()
+    store = _build_store(AVLTree, pages)
+    print(f"-- rebuild from pages: {time.perf_counter() - start:7.3f} seconds")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.wsix")
+        start = time.perf_counter()
+        store.save(path)
+        print(f"-- save:               {time.perf_counter() - start:7.3f} "
+              f"seconds, {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        for name, ds in (("load, memory-mapped", None),
+                         ("load into AVLTree", AVLTree)):
+            start = time.perf_counter()
+            loaded = WebStore.load(path, ds)
+            load_s = time.perf_counter() - start
+            query_us = _time_per_op(loaded.search, vocabulary[:1000])
+            print(f"-- {name:19}: {load_s:7.3f} seconds, then "
+                  f"{query_us:7.2f} microseconds per search")
+
+
+class _KeepAliveHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this a kept-alive
+    # connection waits on delayed ACKs between them.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.connections_lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+
+# Html for num_pages pages of synthetic words, each linking to
+# links_per_page random pages of the set.
+def synthetic_html(num_pages, words_per_page=500, vocabulary_size=5000,
+                   links_per_page=5):
+    pages = synthetic_pages(num_pages, words_per_page, vocabulary_size)
+    rng = random.Random(1)
+    html = []
+    for page, (_, words) in enumerate(pages):
+        links = " ".join(f'<a href="page{rng.randrange(num_pages)}.html">'
+                         f'link</a>' for _ in range(links_per_page))
+        html.append(f"<html><head><title>Page {page}</title></head><body>"
+                    f"<p>{' '.join(words)}</p><p>{links}</p></body></html>")
+    return html
+
+
+# A local stand-in for a real site: the synthetic_html() pages, served over
+# HTTP/1.1 from a temporary directory.  The server counts the TCP
+# connections it accepts.  Call _shutdown_site() on it when done; the
+# directory is removed with it.
+def local_site(num_pages=50, words_per_page=500, vocabulary_size=5000,
+               links_per_page=5):
+    directory = tempfile.TemporaryDirectory()
+    for page, html in enumerate(synthetic_html(num_pages, words_per_page,
+                                               vocabulary_size,
+                                               links_per_page)):
+        with open(os.path.join(directory.name, f"page{page}.html"), "w") as f:
+            f.write(html)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        functools.partial(_KeepAliveHandler, directory=directory.name))
+    server.daemon_threads = True
+    server.connections = 0
+    server.connections_lock = threading.Lock()
+    server.directory = directory
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    server.url = f"http://{host}:{port}/"
+    return server
+
+
+def _shutdown_site(server):
+    server.shutdown()
+    server.server_close()
+    server.directory.cleanup()
+
+
+def bench_fetching(num_pages=200, depth=3):
+    server = local_site(num_pages)
+    url = server.url + "page0.html"
+    print(f"Fetching: crawl of depth {depth} over {num_pages} local pages")
+    for name, get in (("requests.get", requests.get),
+                      ("Fetcher", Fetcher().get)):
+        server.connections = 0
+        start = time.perf_counter()
+        for page in range(num_pages):
+            get(f"{server.url}page{page}.html")
+        fetch_ms = (time.perf_counter() - start) / num_pages * 1000
+        print(f"-- {name:12}: {fetch_ms:5.2f} ms per page, "
+              f"{server.connections} connections for {num_pages} pages")
+    for name, fetcher in (("crawl, shared Fetcher", None),
+                          ("crawl, 2 connections", Fetcher(pool_size=2))):
+        server.connections = 0
+        start = time.perf_counter()
+        store = WebStore(HashQP, fetcher=fetcher)
+        store.crawl(url, depth)
+        print(f"-- {name:21}: {time.perf_counter() - start:5.2f} seconds, "
+              f"{server.connections} connections")
+    _shutdown_site(server)
+
+
+# Times parse_page() with each tokenizer over every .html file below
+# directory (saved pages from a real crawl, say), or over synthetic pages if
+# no directory is given, and checks that they agree.
+def bench_tokenizers(directory=None, num_pages=200):
+    if directory is None:
+        bodies = [html.encode() for html in synthetic_html(num_pages)]
+        source = f"{num_pages} synthetic pages"
+    else:
+        bodies = []
+        for path in glob.glob(os.path.join(directory, "**", "*.html"),
+                              recursive=True):
+            with open(path, "rb") as f:
+                bodies.append(f.read())
+        source = f"{len(bodies)} pages from {directory}"
+    megabytes = sum(len(body) for body in bodies) / 2 ** 20
+    print(f"Tokenizers: {source}, {megabytes:.1f} MiB")
+    results = {}
+    for tokenizer in TOKENIZERS:
+        start = time.perf_counter()
+        results[tokenizer] = [parse_page(body, tokenizer) for body in bodies]
+        elapsed = time.perf_counter() - start
+        print(f"-- {tokenizer:6}: {elapsed / len(bodies) * 1000:6.2f} ms per "
+              f"page, {megabytes / elapsed:5.2f} MiB/s")
+    mismatches = sum(1 for page in zip(*results.values())
+                     if any(result != page[0] for result in page[1:]))
+    print(f"-- {mismatches} pages where the tokenizers disagree")
+
+
+# Crawl throughput with parsing in the fetch threads and in a process pool
+# of each size in worker_counts.  Only scales on a machine with the cores.
+def bench_parse_stage(num_pages=300, depth=3, worker_counts=(1, 2, 4),
+                      parse_batch=8):
+    server = local_site(num_pages, words_per_page=2000)
+    url = server.url + "page0.html"
+    print(f"Parse stage: crawl of depth {depth} over {num_pages} local pages, "
+          f"{os.cpu_count()} cores")
+    for parse_workers in (None,) + tuple(worker_counts):
+        store = WebStore(HashQP, parse_workers=parse_workers,
+                         parse_batch=parse_batch)
+        start = time.perf_counter()
+        pages = sum(1 for _ in store.crawl_stream(url, depth))
+        elapsed = time.perf_counter() - start
+        name = f"{parse_workers} processes" if parse_workers \
+            else "fetch threads"
+        print(f"-- {name:13}: {pages / elapsed:7.1f} pages/s")
+    _shutdown_site(server)
+
+
+# Index build time and batched lookup time for one store against a sharded
+# one, built in this process and in worker processes.
+def bench_sharding(num_pages=2000, words_per_page=500, vocabulary_size=20000,
+                   shards=4, process_counts=(2, 4), lookups=20000):
+    pages = synthetic_pages(num_pages, words_per_page, vocabulary_size)
+    rng = random.Random(2)
+    keys = rng.sample(_vocabulary(vocabulary_size), lookups // 2) + \
+        _random_keys(lookups // 2, 3)
+    print(f"Sharding: {num_pages * words_per_page} postings, {shards} shards, "
+          f"{os.cpu_count()} cores")
+    for ds in (AVLTree, HashQP):
+        print(f"- {ds.__name__}")
+        builds = [("one store", lambda: WebStore(ds)),
+                  ("sharded", lambda: ShardedWebStore(ds, shards))]
+        for processes in process_counts:
+            builds.append((f"sharded, {processes} processes",
+                           lambda processes=processes:
+                           ShardedWebStore(ds, shards, processes)))
+        for name, make in builds:
+            start = time.perf_counter()
+            store = make()
+            if isinstance(store, ShardedWebStore):
+                store.add_pages(pages)
+            else:
+                for url, words in pages:
+                    store._add_page(url, words)
+            build_s = time.perf_counter() - start
+            start = time.perf_counter()
+            store.search_many(keys)
+            lookup_us = (time.perf_counter() - start) / len(keys) * 10 ** 6
+            print(f"-- {name:22}: build {build_s:6.2f} seconds, "
+                  f"search_many {lookup_us:5.2f} microseconds per key")
+
+
+def _store_contents(store):
+    entries = []
+    store._store.traverse(lambda node: entries.append(node.data))
+    return {entry.word: sorted(entry.sites) for entry in entries}
+
+
+# Multi-threaded stress test for ConcurrentWebStore: writer threads index
+# pages while reader threads search, query and batch-search.  Fails on any
+# exception in a thread, on a search returning a url that has not been
+# indexed, or if the final index differs from one built on a single thread.
+def stress_concurrent_store(structures=(BinarySearchTree, SplayTree, AVLTree,
+                                        HashQP, CompactHashQP),
+                            num_pages=400, writers=2, readers=4):
+    pages = synthetic_pages(num_pages, 200, 3000)
+    vocabulary = _vocabulary(3000)
+    print(f"Concurrent store stress test: {writers} writers, {readers} "
+          f"readers, {num_pages} pages")
+    for ds in structures:
+        store = ConcurrentWebStore(ds)
+        urls = {url for url, _ in pages}
+        errors = []
+        reads = [0]
+        writing = threading.Event()
+        writing.set()
+
+        def write(my_pages):
+            try:
+                for url, words in my_pages:
+                    store._add_page(url, words)
+            except Exception as error:
+                errors.append(error)
+
+        def read(seed):
+            rng = random.Random(seed)
+            try:
+                while writing.is_set():
+                    word = rng.choice(vocabulary)
+                    other = rng.choice(vocabulary)
+                    sites = store.search(word) or []
+                    both = store.query(f"{word} {other}")
+                    found, _, _ = store.search_many([word, other])
+                    if not urls.issuperset(sites) or \
+                            not urls.issuperset(both) or \
+                            not all(urls.issuperset(hits)
+                                    for hits in found.values()):
+                        raise AssertionError(f"unknown url for {word}")
+                    reads[0] += 3
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=write, args=(pages[k::writers],))
+                   for k in range(writers)]
+        reader_threads = [threading.Thread(target=read, args=(k,))
+                          for k in range(readers)]
+        for thread in threads + reader_threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writing.clear()
+        for thread in reader_threads:
+            thread.join()
+        expected = _store_contents(_build_store(ds, pages))
+        if _store_contents(store) != expected:
+            errors.append(AssertionError("final index differs"))
+        print(f"-- {ds.__name__:16}: {reads[0]:6} reads during the crawl, "
+              f"{'FAILED ' + repr(errors[0]) if errors else 'ok'}")
+
+
+# Operations per second for a mix of searches and page writes, with the
+# work spread over each number of threads.  Under the GIL extra threads do
+# not add throughput; this measures what the locking costs.
+def bench_concurrent_throughput(structures=(SplayTree, AVLTree, HashQP),
+                                read_fractions=(.5, .9, .99),
+                                thread_counts=(1, 4), operations=20000):
+    pages = synthetic_pages(2000, 100, 5000)
+    vocabulary = _vocabulary(5000)
+    print(f"Concurrent throughput: {operations} operations")
+    for ds in structures:
+        print(f"- {ds.__name__}")
+        for read_fraction in read_fractions:
+            for threads in thread_counts:
+                store = ConcurrentWebStore(ds)
+                for url, words in pages[:1000]:
+                    store._add_page(url, words)
+                new_pages = ((f"{url}?{copy}", words)
+                             for copy in range(operations)
+                             for url, words in pages[1000:])
+                pages_lock = threading.Lock()
+
+                def work(seed, count):
+                    rng = random.Random(seed)
+                    for _ in range(count):
+                        if rng.random() < read_fraction:
+                            store.search(rng.choice(vocabulary))
+                        else:
+                            with pages_lock:
+                                url, words = next(new_pages)
+                            store._add_page(url, words)
+
+                workers = [threading.Thread(target=work,
+                                            args=(k, operations // threads))
+                           for k in range(threads)]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                rate = operations / (time.perf_counter() - start)
+                print(f"-- {read_fraction * 100:4.0f}% reads, {threads} "
+                      f"threads: {rate:9.0f} operations/s")
+
+
+# autocomplete() on an ordered backend against the full scan a hash table
+# (or the trees' old traverse()) needs.
+def bench_autocomplete(sizes=(10_000, 100_000), k=10, requests=2000):
+    print(f"Autocomplete: top {k} completions of 2 and 4 letter prefixes")
+    for size in sizes:
+        keys = sorted(_random_keys(size, size))
+        entries = [KeywordEntry(key) for key in keys]
+        rng = random.Random(1)
+        print(f"- {size} keywords")
+        for ds in (AVLTree, SplayTree, HashQP):
+            store = WebStore(ds)
+            if hasattr(ds, "from_sorted"):
+                store._store = ds.from_sorted(entries)
+            else:
+                for entry in entries:
+                    store._store.insert(entry)
+            for length in (2, 4):
+                prefixes = [key[:length] for key in rng.choices(keys,
+                                                                 k=requests)]
+                count = requests if ds is not HashQP else requests // 100
+                time_us = _time_per_op(store.autocomplete, prefixes[:count])
+                print(f"-- {ds.__name__:9} {length} letters: {time_us:9.2f} "
+                      f"microseconds per request")
+
+
+# BM25 ranked search on a 100k page index.  Each query is timed returning
+# the top k through the heap and returning every match in order, which is
+# what a full sort of the matches costs.
+def bench_ranked_search(num_pages=100_000, words_per_page=50,
+                        vocabulary_size=20000, k=10, trials=5):
+    pages = synthetic_pages(num_pages, words_per_page, vocabulary_size)
+    store = _build_store(HashQP, pages)
+    vocabulary = _vocabulary(vocabulary_size)
+    common, middling, rare = vocabulary[0], vocabulary[50], vocabulary[5000]
+    store.ranked_search(common, k)
+    print(f"Ranked search: {num_pages} pages, "
+          f"{num_pages * words_per_page} postings")
+    for text in (rare, middling, f"{middling} {rare}", common,
+                 f"{common} {middling} {rare}"):
+        matches = len(store.query(" OR ".join(text.split())))
+        top_ms = timeit.timeit(lambda: store.ranked_search(text, k),
+                               number=trials) / trials * 1000
+        all_ms = timeit.timeit(lambda: store.ranked_search(text, num_pages),
+                               number=trials) / trials * 1000
+        print(f"-- {matches:6} matches: top {k} {top_ms:8.2f} ms, "
+              f"all sorted {all_ms:8.2f} ms  ({text})")
+
+
+# Repeated keyword searches, Zipf-distributed like the pages and half of
+# them for words not in the index, with the result cache off and on.
+def bench_query_cache(num_pages=500, words_per_page=200, vocabulary_size=5000,
+                      searches=20000, cache_size=1000):
+    pages = synthetic_pages(num_pages, words_per_page, vocabulary_size)
+    rng = random.Random(2)
+    vocabulary = _vocabulary(vocabulary_size)
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    absent = _vocabulary(vocabulary_size, seed=3)
+    keywords = [word for pair in zip(
+        rng.choices(vocabulary, weights, k=searches // 2),
+        rng.choices(absent, weights, k=searches // 2)) for word in pair]
+    print(f"Query cache: {searches} searches, {cache_size} entries")
+    for ds in (BinarySearchTree, SplayTree, AVLTree, HashQP):
+        store = _build_store(ds, pages)
+        off_us = _time_per_op(store.search, keywords)
+        store.set_cache(cache_size)
+        on_us = _time_per_op(store.search, keywords)
+        cache = store.cache
+        print(f"-- {ds.__name__:16} off {off_us:6.2f}, on {on_us:6.2f} "
+              f"microseconds per search; {cache.hits} hits, {cache.misses} "
+              f"misses, {cache.evictions} evictions")
+
+
+# search() for keywords that are not in the index, without a Bloom filter and
+# with one at several false-positive rates, and the cost it adds to a hit.
+def bench_bloom_filter(size=100_000, lookups=20_000,
+                       error_rates=(.1, .01, .001)):
+    keys = sorted(_random_keys(size, 4))
+    absent = _random_keys(lookups, 5)
+    present = random.Random(6).sample(keys, lookups)
+    print(f"Bloom filter: {size} keywords, {lookups} misses and hits")
+    for ds in (BinarySearchTree, SplayTree, AVLTree, HashQP):
+        store = WebStore(ds)
+        if hasattr(ds, "from_sorted"):
+            store._store = ds.from_sorted([KeywordEntry(key) for key in keys])
+        else:
+            for key in keys:
+                store._store.insert(KeywordEntry(key))
+        miss_us = _time_per_op(store.search, absent)
+        hit_us = _time_per_op(store.search, present)
+        print(f"- {ds.__name__:16} no filter: miss {miss_us:5.2f}, "
+              f"hit {hit_us:5.2f} microseconds")
+        for error_rate in error_rates:
+            store.set_bloom_filter(error_rate)
+            passed = sum(1 for key in absent if key in store._filter)
+            filtered_us = _time_per_op(store.search, absent)
+            hit_us = _time_per_op(store.search, present)
+            print(f"-- rate {error_rate:<5}: miss {filtered_us:5.2f} "
+                  f"({miss_us / filtered_us:4.1f}x), hit {hit_us:5.2f} "
+                  f"microseconds, {passed / lookups:.2%} false positives, "
+                  f"{len(store._filter._bits) / 1024:.0f} KiB")
+        store.set_bloom_filter(None)
+
+
+def _find_or_none(store, key):
+    try:
+        return store.find(key)
+    except store.NotFoundError:
+        return None
+
+
+# Hits and misses through find() with the exception caught, as WebStore used
+# to look keywords up, against get().
+def bench_get(size=100_000, lookups=20_000):
+    keys = sorted(_random_keys(size, 4))
+    absent = _random_keys(lookups, 5)
+    present = random.Random(6).sample(keys, lookups)
+    print(f"find() and get(): {size} keywords, {lookups} lookups")
+    for ds in (BinarySearchTree, SplayTree, AVLTree, HashQP):
+        if hasattr(ds, "from_sorted"):
+            store = ds.from_sorted([KeywordEntry(key) for key in keys])
+        else:
+            store = ds()
+            for key in keys:
+                store.insert(KeywordEntry(key))
+        find = functools.partial(_find_or_none, store)
+        for name, items in (("hit", present), ("miss", absent)):
+            find_us = _time_per_op(find, items)
+            get_us = _time_per_op(store.get, items)
+            print(f"-- {ds.__name__:16} {name:4}: find {find_us:5.2f}, "
+                  f"get {get_us:5.2f} microseconds")
+
+
+class _DictTreeNode:
+    # BinaryTreeNode and AVLTreeNode as they were before __slots__, with a
+    # __dict__ per node, as the baseline for bench_tree_memory().
+
+    def __init__(self, data):
+        self.data = data
+        self.left_child = None
+        self.right_child = None
+
+
+class _DictAVLTreeNode(_DictTreeNode):
+    calc_height = AVLTreeNode.calc_height
+    balance = AVLTreeNode.balance
+
+    def __init__(self, data):
+        self.height = 0
+        super().__init__(data)
+
+
+class _DictBinarySearchTree(BinarySearchTree):
+
+    def _new_node(self, data):
+        return _DictTreeNode(data)
+
+
+class _DictAVLTree(AVLTree):
+
+    def _new_node(self, data):
+        return _DictAVLTreeNode(data)
+
+
+# Bytes of tree structure per stored keyword, traced while inserting
+# keywords in random order into each tree backend.  The KeywordEntry objects
+# are created first, so only the nodes are counted.
+def bench_tree_memory(size=100_000):
+    entries = [KeywordEntry(key) for key in _random_keys(size, 7)]
+    print(f"Tree memory: {size} keywords")
+    for tree_class in (_DictBinarySearchTree, BinarySearchTree, SplayTree,
+                       _DictAVLTree, AVLTree):
+        def build():
+            tree = tree_class()
+            for entry in entries:
+                tree.insert(entry)
+            return tree
+        used, tree = _measure(build)
+        print(f"-- {tree_class.__name__:21} {used / size:6.1f} bytes per "
+              f"keyword")
+        del tree
+
+
+if __name__ == "__main__":
+    bench_postings_memory()
+    bench_boolean_queries()
+    bench_tree_operations()
+    bench_hash_layout()
+    bench_hash_functions()
+    bench_insert_latency()
+    bench_index_file()
+    bench_fetching()
+    bench_tokenizers()
+    bench_parse_stage()
+    bench_sharding()
+    stress_concurrent_store()
+    bench_concurrent_throughput()
+    bench_autocomplete()
+    bench_ranked_search()
+    bench_query_cache()
+    bench_bloom_filter()
+    bench_get()
+    bench_tree_memory()
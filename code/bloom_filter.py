@@ -0,0 +1,71 @@
+import math
+
+
+class BloomFilter:
+    # Set of strings that can answer "definitely not present" without
+    # storing them: each key sets num_hashes bits of a bit array, sized so
+    # that a key never added is reported present with probability about
+    # error_rate while no more than capacity keys are in it.  Keys cannot be
+    # removed.  Bit positions come from Python's string hash (cached on the
+    # string) by double hashing, so a filter is only meaningful within the
+    # process that built it.
+
+    def __init__(self, capacity, error_rate):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        capacity = max(capacity, 1)
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._num_bits = max(8, math.ceil(-capacity * math.log(error_rate)
+                                          / math.log(2) ** 2))
+        self._num_hashes = max(1, round(self._num_bits / capacity
+                                        * math.log(2)))
+        self._bits = bytearray((self._num_bits + 7) // 8)
+        self._count = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def error_rate(self):
+        return self._error_rate
+
+    @property
+    def num_bits(self):
+        return self._num_bits
+
+    @property
+    def num_hashes(self):
+        return self._num_hashes
+
+    # Keys added, counting repeats.
+    def __len__(self):
+        return self._count
+
+    @property
+    def full(self):
+        return self._count > self._capacity
+
+    def add(self, key):
+        value = hash(key)
+        step = (value >> 32 & 0xffffffff) | 1
+        bits = self._bits
+        size = self._num_bits
+        for _ in range(self._num_hashes):
+            bit = value % size
+            bits[bit >> 3] |= 1 << (bit & 7)
+            value += step
+        self._count += 1
+
+    def __contains__(self, key):
+        value = hash(key)
+        step = (value >> 32 & 0xffffffff) | 1
+        bits = self._bits
+        size = self._num_bits
+        for _ in range(self._num_hashes):
+            bit = value % size
+            if not bits[bit >> 3] & 1 << (bit & 7):
+                return False
+            value += step
+        return True
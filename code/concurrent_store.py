@@ -0,0 +1,227 @@
+import threading
+from contextlib import contextmanager
+
+from main import WebStore
+
+
+class ReadWriteLock:
+    # Any number of readers, or one writer.  A waiting writer holds back new
+    # readers, so a steady stream of queries cannot starve a crawl.  The
+    # writer may take the lock again, for reading or writing; a reader may
+    # not upgrade to writing.
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._condition:
+            if self._writer == threading.get_ident():
+                self._write_depth += 1
+                return
+            while self._writer is not None or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            if self._writer == threading.get_ident():
+                self._write_depth -= 1
+                return
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            if self._writer == threading.get_ident():
+                self._write_depth += 1
+                return
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = threading.get_ident()
+            self._write_depth = 1
+
+    def release_write(self):
+        with self._condition:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class SnapshotStore:
+    # Lets threads share a structure whose lookups modify it (SplayTree).
+    # Lookups are answered from a snapshot of the entries, a dict that is
+    # never touched by a read; insert() and remove() change both the
+    # structure and the snapshot.  The owner must keep writes exclusive of
+    # reads, as ConcurrentWebStore does, so the snapshot is updated in place
+    # rather than copied on every write.
+
+    def __init__(self, store):
+        self._store = store
+        self._snapshot = {}
+        store.traverse(lambda node: self._snapshot.__setitem__(
+            node.data.word, node.data))
+        self.NotFoundError = store.NotFoundError
+
+    @property
+    def size(self):
+        return self._store.size
+
+    def find(self, key):
+        if type(key) is str:
+            key = key.upper()
+        entry = self._snapshot.get(key)
+        if entry is None:
+            raise self.NotFoundError
+        return entry
+
+    def get(self, key, default=None):
+        if type(key) is str:
+            key = key.upper()
+        return self._snapshot.get(key, default)
+
+    def find_many(self, keys):
+        found = {}
+        for key in keys:
+            if type(key) is str:
+                key = key.upper()
+            entry = self._snapshot.get(key)
+            if entry is not None:
+                found[key] = entry
+        return found
+
+    def __contains__(self, key):
+        if type(key) is str:
+            key = key.upper()
+        return key in self._snapshot
+
+    def insert(self, data):
+        inserted = self._store.insert(data)
+        if inserted is not False:
+            self._snapshot[data.word] = data
+        return inserted
+
+    def remove(self, data):
+        key = data if type(data) is str else data.word
+        removed = self._store.remove(key)
+        self._snapshot.pop(key, None)
+        return removed
+
+    def traverse(self, function):
+        self._store.traverse(function)
+
+    # Ordered walks do not splay, so they can use the structure itself.
+    def range(self, low=None, high=None):
+        return self._store.range(low, high)
+
+    def prefix(self, prefix):
+        return self._store.prefix(prefix)
+
+
+class ConcurrentWebStore(WebStore):
+    # A WebStore that can be searched from any number of threads while a
+    # crawl is writing to it.  Searches share a readers-writer lock; indexing
+    # takes it exclusively one page at a time, so queries interleave with a
+    # crawl page by page and never see a half-indexed page or a postings list
+    # in the middle of an append.  Structures whose lookups modify them are
+    # read through a SnapshotStore, however the store was built, load()
+    # included.  Document lengths for ranked_search() are brought up to date
+    # under the write lock, so no reader ever rebuilds them.  Options are
+    # passed on to WebStore.
+
+    def __init__(self, ds, **options):
+        self._lock = ReadWriteLock()
+        super().__init__(ds, **options)
+
+    def _wrap_store(self, store):
+        if getattr(type(store), "READS_MODIFY", False):
+            return SnapshotStore(store)
+        return store
+
+    @property
+    def lock(self):
+        return self._lock
+
+    def _add_page(self, link, words):
+        with self._lock.write():
+            self._update_lengths()
+            super()._add_page(link, words)
+
+    def _replace_page(self, link, words):
+        with self._lock.write():
+            self._update_lengths()
+            super()._replace_page(link, words)
+
+    def _compact_step(self):
+        with self._lock.write():
+            super()._compact_step()
+
+    def _load_pending(self):
+        with self._lock.write():
+            super()._load_pending()
+            self._update_lengths()
+
+    def set_cache(self, capacity):
+        with self._lock.write():
+            super().set_cache(capacity)
+
+    def set_bloom_filter(self, error_rate):
+        with self._lock.write():
+            super().set_bloom_filter(error_rate)
+
+    def save(self, path):
+        with self._lock.write():
+            super().save(path)
+
+    def search(self, keyword: str):
+        with self._lock.read():
+            return super().search(keyword)
+
+    def search_many(self, kw_list: list):
+        with self._lock.read():
+            return super().search_many(kw_list)
+
+    def query(self, text: str) -> list:
+        with self._lock.read():
+            return super().query(text)
+
+    def search_phrase(self, phrase: str) -> list:
+        with self._lock.read():
+            return super().search_phrase(phrase)
+
+    # load() brings the lengths with the index and every write keeps them
+    # current; if they are ever behind, they are rebuilt under the write
+    # lock rather than by a reader.
+    def ranked_search(self, text: str, k=10) -> list:
+        if not self._lengths_current():
+            with self._lock.write():
+                self._update_lengths()
+        with self._lock.read():
+            return super().ranked_search(text, k)
+
+    def autocomplete(self, prefix: str, k=10) -> list:
+        with self._lock.read():
+            return super().autocomplete(prefix, k)
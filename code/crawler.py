@@ -0,0 +1,491 @@
+from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+from bs4.element import Comment
+import requests
+
+import hashlib
+import multiprocessing
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from fetcher import shared_fetcher
+
+HEADERS = {
+    'User-Agent': ''}
+
+
+def tag_visible(element):
+    if element.parent.name in ['style', 'script', 'head', 'title', 'meta', '[document]']:
+        return False
+    if isinstance(element, Comment):
+        return False
+    return True
+
+
+def _words_from_soup(soup):
+    texts = soup.find_all(string=True)
+    visible_texts = filter(tag_visible, texts)
+    text_string = " ".join(t for t in visible_texts)
+    words = re.findall(r'\w+', text_string)
+    return words
+
+
+def _hrefs_from_soup(soup):
+    return [link.get('href') for link in soup.find_all('a', href=True)]
+
+
+def _links_from_hrefs(url, hrefs, pattern):
+    return [urljoin(url, href) for href in hrefs if pattern.search(href)]
+
+
+INVISIBLE_TAGS = frozenset(['style', 'script', 'head', 'title', 'meta',
+                            '[document]'])
+
+# Tags BeautifulSoup closes as soon as they open.
+VOID_TAGS = frozenset(['area', 'base', 'basefont', 'bgsound', 'br', 'col',
+                       'command', 'embed', 'frame', 'hr', 'image', 'img',
+                       'input', 'isindex', 'keygen', 'link', 'menuitem',
+                       'meta', 'nextid', 'param', 'source', 'spacer', 'track',
+                       'wbr'])
+
+_WORD = re.compile(r'\w+')
+
+
+class _PageParser(HTMLParser):
+    # Streaming equivalent of BeautifulSoup(body, 'html.parser') followed by
+    # _words_from_soup() and _hrefs_from_soup().  Only the stack of open tag
+    # names is kept, opened and closed the way BeautifulSoup's tree builder
+    # does it, because tag_visible() only looks at a string's parent.  Text
+    # is buffered until the next tag, comment or declaration ends the string,
+    # then its words go straight into self.words if the parent is visible.
+
+    def __init__(self, with_words=True):
+        super().__init__(convert_charrefs=False)
+        self._with_words = with_words
+        self._stack = ['[document]']
+        self._text = []
+        self._closed_void = []
+        self.words = []
+        self.hrefs = []
+
+    def _end_string(self):
+        if self._text:
+            if self._with_words and self._stack[-1] not in INVISIBLE_TAGS:
+                self.words += _WORD.findall("".join(self._text))
+            self._text = []
+
+    def _special_string(self, text):
+        self._end_string()
+        self._text.append(text)
+        self._end_string()
+
+    def _open(self, tag, attrs):
+        self._end_string()
+        self._stack.append(tag)
+        if tag == 'a':
+            href = None
+            for name, value in attrs:
+                if name == 'href':
+                    href = value if value is not None else ""
+            if href is not None:
+                self.hrefs.append(href)
+
+    def _close(self, tag):
+        self._end_string()
+        if tag in self._stack[1:]:
+            while self._stack.pop() != tag:
+                pass
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag, attrs)
+        if tag in VOID_TAGS:
+            self._close(tag)
+            self._closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag, attrs)
+        self._close(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void:
+            self._closed_void.remove(tag)
+        else:
+            self._close(tag)
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    # html.parser only reports well-formed references here (digits, or x and
+    # hex digits), converted as BeautifulSoup converts them.
+    def handle_charref(self, name):
+        if name[0] in 'xX':
+            number = int(name[1:], 16)
+        else:
+            number = int(name)
+        self._text.append(UnicodeDammit.numeric_character_reference(number)[0])
+
+    def handle_entityref(self, name):
+        self._text.append(EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(
+            name, "&" + name))
+
+    def handle_comment(self, data):
+        self._end_string()
+
+    def handle_decl(self, decl):
+        self._special_string(decl[len("DOCTYPE "):])
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            data = data[len("CDATA["):]
+        self._special_string(data)
+
+    def handle_pi(self, data):
+        self._special_string(data)
+
+    def close(self):
+        super().close()
+        self._end_string()
+
+
+# Page tokenizers: "soup" builds a BeautifulSoup tree and walks its strings;
+# "stream" gets the same words and hrefs from html.parser callbacks without
+# building a tree or joining the text.
+TOKENIZERS = ("stream", "soup")
+DEFAULT_TOKENIZER = "stream"
+
+
+# Returns (words, hrefs) for a page body, bytes or str.  Bytes are decoded
+# the way BeautifulSoup decodes them.
+def parse_page(body, tokenizer=None, with_words=True):
+    if tokenizer is None:
+        tokenizer = DEFAULT_TOKENIZER
+    if tokenizer == "soup":
+        soup = BeautifulSoup(body, features="html.parser")
+        words = _words_from_soup(soup) if with_words else []
+        return words, _hrefs_from_soup(soup)
+    if tokenizer != "stream":
+        raise ValueError(f"Unknown tokenizer {tokenizer!r}, expected one of "
+                         f"{', '.join(TOKENIZERS)}")
+    if isinstance(body, bytes):
+        body = UnicodeDammit(body, is_html=True).unicode_markup
+    parser = _PageParser(with_words)
+    parser.feed(body)
+    parser.close()
+    return parser.words, parser.hrefs
+
+
+def words_from_html(body, tokenizer=None):
+    return parse_page(body, tokenizer)[0]
+
+
+# A ProcessPoolExecutor of workers processes, started from a fork server
+# where the platform has one, so that they are not forked from a process
+# with live threads.
+def process_pool(workers):
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context()
+    return ProcessPoolExecutor(workers, mp_context=context)
+
+
+# Runs in a parse worker process.  The words of each page go back as one
+# space-separated string (a \w+ word never contains whitespace), which is
+# much cheaper to pickle than a list of short strings.
+def _parse_batch(bodies, tokenizer, with_words):
+    results = []
+    for body in bodies:
+        words, hrefs = parse_page(body, tokenizer, with_words)
+        results.append((" ".join(words), hrefs))
+    return results
+
+
+def text_harvester(url, fetcher=None):
+    if fetcher is None:
+        fetcher = shared_fetcher()
+    try:
+        page = fetcher.get(url, headers=HEADERS)
+    except requests.RequestException:
+        return []
+    res = words_from_html(page.content)
+
+    return res
+
+
+class PageRecord:
+    # What an incremental crawl remembers about a page between crawls: the
+    # ETag and Last-Modified validators it was served with, a hash of its
+    # body, and its hrefs, so that the links of an unchanged page can still
+    # be followed without fetching it again.
+
+    def __init__(self, etag, last_modified, digest, hrefs):
+        self._etag = etag
+        self._last_modified = last_modified
+        self._digest = digest
+        self._hrefs = hrefs
+
+    @property
+    def etag(self):
+        return self._etag
+
+    @property
+    def last_modified(self):
+        return self._last_modified
+
+    @property
+    def digest(self):
+        return self._digest
+
+    @property
+    def hrefs(self):
+        return self._hrefs
+
+    def conditional_headers(self):
+        headers = dict(HEADERS)
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        return headers
+
+
+class Crawler:
+    # Breadth-first crawl engine.  Each level of the crawl is fetched
+    # concurrently by a pool of worker threads, every URL is fetched at most
+    # once, and no more than per_host requests are in flight to any one host.
+
+    DEFAULT_WORKERS = 8
+    DEFAULT_PER_HOST = 4
+    DEFAULT_PARSE_BATCH = 8
+    GONE_STATUSES = (404, 410)
+
+    # records, if given, makes the crawl incremental: a dict of url ->
+    # PageRecord from earlier crawls, which is kept up to date as pages are
+    # consumed.  Known pages are fetched with conditional requests, and a
+    # page that is not modified (a 304, or a body with the same hash) is
+    # yielded with None for its words, as is a page the server cannot serve
+    # (a connection error, or an error status other than GONE_STATUSES).  A
+    # page that is gone (404 or 410) is yielded with no words and its record
+    # is dropped.
+    # Pages are fetched with fetcher, the shared Fetcher unless one is given,
+    # and split into words with tokenizer (see TOKENIZERS).
+    # parse_workers, if set, moves parsing out of the fetch threads into that
+    # many worker processes, which get the raw page bytes parse_batch pages
+    # at a time; parsing is CPU bound and the threads share one GIL.
+    def __init__(self, workers=None, per_host=None, records=None,
+                 fetcher=None, tokenizer=None, parse_workers=None,
+                 parse_batch=None):
+        self._workers = workers if workers else Crawler.DEFAULT_WORKERS
+        self._per_host = per_host if per_host else Crawler.DEFAULT_PER_HOST
+        self._records = records
+        self._fetcher = fetcher if fetcher is not None else shared_fetcher()
+        self._tokenizer = tokenizer
+        self._parse_workers = parse_workers
+        self._parse_batch = parse_batch if parse_batch \
+            else Crawler.DEFAULT_PARSE_BATCH
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def per_host(self):
+        return self._per_host
+
+    @property
+    def parse_workers(self):
+        return self._parse_workers
+
+    @property
+    def parse_batch(self):
+        return self._parse_batch
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = \
+                    threading.BoundedSemaphore(self._per_host)
+            return self._host_limits[host]
+
+    @property
+    def records(self):
+        return self._records
+
+    # Fetches url.  Returns (url, result, body, record): result is the
+    # finished (url, words, links, record) when there is nothing to parse (a
+    # failed fetch, or a page that has not changed), otherwise None, with
+    # body the page to parse and, in an incremental crawl, record its new
+    # PageRecord still waiting for its hrefs.
+    def _download(self, url, pattern):
+        record = None
+        headers = HEADERS
+        if self._records is not None:
+            record = self._records.get(url)
+            if record is not None:
+                headers = record.conditional_headers()
+        with self._host_limit(url):
+            try:
+                page = self._fetcher.get(url, headers=headers)
+            except requests.RequestException:
+                return self._unavailable(url, record, pattern)
+        if self._records is None:
+            return url, None, page.content, None
+        # A page the server says is gone is removed from the index.  Any
+        # other error that outlasted the fetcher's retries is not the page's
+        # content, so it must not replace what the index holds for it.
+        if page.status_code in Crawler.GONE_STATUSES:
+            print("Page gone", url)
+            return url, (url, [], [], None), None, None
+        if not page.ok:
+            return self._unavailable(url, record, pattern)
+        if record is not None and page.status_code == 304:
+            return url, (url, None, _links_from_hrefs(
+                url, record.hrefs, pattern), record), None, None
+        digest = hashlib.sha1(page.content).digest()
+        etag = page.headers.get('ETag')
+        last_modified = page.headers.get('Last-Modified')
+        if record is not None and record.digest == digest:
+            return url, (url, None, _links_from_hrefs(
+                url, record.hrefs, pattern), PageRecord(
+                etag, last_modified, digest, record.hrefs)), None, None
+        return (url, None, page.content,
+                PageRecord(etag, last_modified, digest, None))
+
+    @staticmethod
+    def _unavailable(url, record, pattern):
+        print("Cannot retrieve", url)
+        if record is None:
+            return url, (url, [], [], None), None, None
+        # Keep the page as it was rather than index it as empty.
+        return url, (url, None, _links_from_hrefs(
+            url, record.hrefs, pattern), None), None, None
+
+    @staticmethod
+    def _parsed(url, pattern, words, hrefs, record):
+        if record is not None:
+            record = PageRecord(record.etag, record.last_modified,
+                                record.digest, hrefs)
+        return url, words, _links_from_hrefs(url, hrefs, pattern), record
+
+    # One request and one parse per page: the same parse supplies both the
+    # visible words and the outgoing links.  Returns (url, words, links,
+    # record), record being the page's new PageRecord in an incremental
+    # crawl and None otherwise.
+    def _harvest(self, url, pattern, with_words=True):
+        url, result, body, record = self._download(url, pattern)
+        if result is not None:
+            return result
+        words, hrefs = parse_page(body, self._tokenizer, with_words)
+        return self._parsed(url, pattern, words, hrefs, record)
+
+    def _parse_pool(self):
+        if not self._parse_workers:
+            return nullcontext()
+        return process_pool(self._parse_workers)
+
+    # Fetches and parses one level of the crawl, yielding (url, words, links,
+    # record) for each page as it is finished.  Without a parse pool each
+    # fetch thread parses its own page.  With one, fetched bodies are queued
+    # and sent to the worker processes parse_batch at a time (the last batch
+    # of a level as soon as the level's downloads are done), so fetching the
+    # rest of the level carries on while earlier pages are parsed.
+    def _level(self, pool, parse_pool, frontier, pattern, with_words):
+        if parse_pool is None:
+            futures = [pool.submit(self._harvest, link, pattern, with_words)
+                       for link in frontier]
+            for future in as_completed(futures):
+                yield future.result()
+            return
+        pending = {pool.submit(self._download, link, pattern)
+                   for link in frontier}
+        downloads = len(pending)
+        batches = {}
+        batch = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in batches:
+                    for (url, record), (text, hrefs) in \
+                            zip(batches.pop(future), future.result()):
+                        yield self._parsed(url, pattern, text.split(), hrefs,
+                                           record)
+                    continue
+                downloads -= 1
+                url, result, body, record = future.result()
+                if result is not None:
+                    yield result
+                else:
+                    batch.append((url, record, body))
+            if batch and (len(batch) >= self._parse_batch or not downloads):
+                future = parse_pool.submit(
+                    _parse_batch, [body for _, _, body in batch],
+                    self._tokenizer, with_words)
+                batches[future] = [(url, record) for url, record, _ in batch]
+                pending.add(future)
+                batch = []
+
+    # Yields (url, words, outlinks) for every URL within depth links of url,
+    # in the order the pages finish downloading.
+    # Pages on the last level are only fetched when with_words is set, as
+    # their links are never followed.
+    def _walk(self, url, depth, reg_ex, with_words):
+        pattern = re.compile(reg_ex)
+        seen = {url}
+        frontier = [url]
+        with ThreadPoolExecutor(max_workers=self._workers) as pool, \
+                self._parse_pool() as parse_pool:
+            for level in range(depth + 1):
+                if level == depth and not with_words:
+                    for link in frontier:
+                        yield link, [], []
+                    return
+                next_frontier = []
+                for page_url, words, links, record in self._level(
+                        pool, parse_pool, frontier, pattern, with_words):
+                    yield page_url, words, links
+                    # Only recorded once the page has been consumed, so a
+                    # crawl stopped early does not mark unindexed pages as
+                    # up to date.
+                    if record is not None:
+                        self._records[page_url] = record
+                    # Indexed afresh without a record: the page is gone.
+                    elif words is not None and self._records is not None:
+                        self._records.pop(page_url, None)
+                    if level == depth:
+                        continue
+                    for link in links:
+                        if link not in seen:
+                            seen.add(link)
+                            next_frontier.append(link)
+                frontier = next_frontier
+
+    def pages(self, url, depth=0, reg_ex=""):
+        return self._walk(url, depth, reg_ex, True)
+
+    # Returns every URL within depth links of url, url included.  A page is
+    # only fetched if its links can still lead somewhere within depth, so the
+    # result matches the old recursive _link_fisher.
+    def crawl(self, url, depth=0, reg_ex=""):
+        return [link for link, _, _ in self._walk(url, depth, reg_ex, False)]
+
+
+def harvest(url, depth=0, reg_ex="", workers=None, per_host=None,
+            records=None, fetcher=None, parse_workers=None, parse_batch=None):
+    return Crawler(workers, per_host, records, fetcher,
+                   parse_workers=parse_workers,
+                   parse_batch=parse_batch).pages(url, depth, reg_ex)
+
+
+def link_fisher(url, depth=0, reg_ex="", workers=None, per_host=None,
+                fetcher=None, parse_workers=None, parse_batch=None):
+    return Crawler(workers, per_host, fetcher=fetcher,
+                   parse_workers=parse_workers,
+                   parse_batch=parse_batch).crawl(url, depth, reg_ex)
@@ -0,0 +1,95 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import threading
+from urllib.parse import urlsplit
+
+
+class Fetcher:
+    # Fetches pages over pooled, keep-alive connections.  Each host gets its
+    # own requests.Session holding up to pool_size open connections, so
+    # consecutive pages from one site reuse a TCP (and TLS) connection instead
+    # of opening a new one per page.  A request that fails to connect, or gets
+    # a 502, 503 or 504, is retried up to retries times with a short backoff;
+    # timeout is in seconds and applies to connecting and to each read.
+    # Sessions are safe to share between the crawler's worker threads.
+
+    DEFAULT_POOL_SIZE = 8
+    DEFAULT_TIMEOUT = 10
+    DEFAULT_RETRIES = 2
+    RETRY_STATUSES = (502, 503, 504)
+    BACKOFF_FACTOR = .2
+
+    def __init__(self, pool_size=None, timeout=None, retries=None):
+        self._pool_size = pool_size if pool_size else Fetcher.DEFAULT_POOL_SIZE
+        self._timeout = timeout if timeout else Fetcher.DEFAULT_TIMEOUT
+        self._retries = retries if retries is not None \
+            else Fetcher.DEFAULT_RETRIES
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def retries(self):
+        return self._retries
+
+    def _new_session(self):
+        retry = Retry(total=self._retries, connect=self._retries,
+                      read=self._retries, status=self._retries,
+                      backoff_factor=Fetcher.BACKOFF_FACTOR,
+                      status_forcelist=Fetcher.RETRY_STATUSES,
+                      allowed_methods=("GET", "HEAD"),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self._pool_size,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def session(self, url):
+        host = urlsplit(url).netloc
+        with self._sessions_lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._new_session()
+            return self._sessions[host]
+
+    # Raises requests.RequestException if the page cannot be fetched.
+    def get(self, url, headers=None):
+        return self.session(url).get(url, headers=headers,
+                                     timeout=self._timeout)
+
+    def close(self):
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+
+# The Fetcher used wherever one is not passed in, so that separate crawls
+# and text_harvester() calls keep reusing the same connections.
+def shared_fetcher():
+    global _shared_fetcher
+    with _shared_fetcher_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = Fetcher()
+        return _shared_fetcher
@@ -1,8 +1,44 @@
-import copy
 import math
+from array import array
 from enum import Enum
 
 
+HASH_MASK = (1 << 63) - 1
+
+
+# Key hash strategies for HashQP and CompactHashQP.  Each returns a
+# non-negative int below 2 ** 63, so it can be cached in an array('q').
+
+# The original hash: 37 * h + ord(c) over every character, in pure Python.
+def polynomial_hash(item):
+    return_value = 0
+    for char in item:
+        return_value = 37 * return_value + ord(char)
+    return return_value & HASH_MASK
+
+
+# 64 bit FNV-1a over the UTF-8 bytes of the key.
+def fnv1a_hash(item):
+    return_value = 0xcbf29ce484222325
+    for byte in item.encode():
+        return_value = ((return_value ^ byte) * 0x100000001b3) \
+            & 0xffffffffffffffff
+    return return_value & HASH_MASK
+
+
+# Python's own string hash: computed in C and cached on the str object, so
+# it is by far the cheapest, but it is salted per process (PYTHONHASHSEED).
+def builtin_hash(item):
+    return hash(item) & HASH_MASK
+
+
+HASH_FUNCTIONS = {
+    "polynomial": polynomial_hash,
+    "fnv1a": fnv1a_hash,
+    "builtin": builtin_hash,
+}
+
+
 class HashEntry:
     class State(Enum):
         ACTIVE = 0
@@ -13,6 +49,16 @@ class HashEntry:
         self._data = data
         self._state = HashEntry.State.EMPTY
         self._sites = site
+        self._hash = None
+
+    @property
+    def data(self):
+        return self._data
+
+
+# Shared by every empty bucket, so a table of any size is one list multiply.
+# It is never written to: insert() puts a new HashEntry in the bucket.
+EMPTY_ENTRY = HashEntry()
 
 
 class HashQP:
@@ -21,30 +67,59 @@ class HashQP:
 
     INIT_TABLE_SIZE = 97
     INIT_MAX_LAMBDA = .49
+    INIT_MIN_LAMBDA = .12
+    MIGRATE_STEP = 64
+
+    DEFAULT_HASH_FUNCTION = "builtin"
 
-    def __init__(self, table_size=None):
+    # hash_function is a name from HASH_FUNCTIONS or any callable that maps
+    # a key to a non-negative int below 2 ** 63.
+    # With incremental_compaction set, a table that is mostly tombstones is
+    # rebuilt a few buckets at a time (see compact_step()) rather than all at
+    # once inside the insert() that noticed it.  incremental_rehash does the
+    # same for every rebuild, growing and shrinking included, so no single
+    # insert pays for copying the whole table.
+    def __init__(self, table_size=None, hash_function=None,
+                 incremental_compaction=False, incremental_rehash=False):
 
         self._sites = None
         if table_size is None or table_size < HashQP.INIT_TABLE_SIZE:
             self._table_size = self._next_prime(HashQP.INIT_TABLE_SIZE)
         else:
             self._table_size = self._next_prime(table_size)
-        self._buckets = [HashEntry() for _ in range(self._table_size)]
+        self._hash_function = self._resolve_hash_function(hash_function)
+        self._buckets = self._new_buckets(self._table_size)
         self._max_lambda = HashQP.INIT_MAX_LAMBDA
+        self._min_lambda = HashQP.INIT_MIN_LAMBDA
         self._size = 0
         self._load_size = 0
+        self._incremental_compaction = incremental_compaction
+        self._incremental_rehash = incremental_rehash
+        self._old_buckets = None
+        self._migrate_pos = 0
 
-    def _internal_hash(self, item):
-        return_value = 0
+    @staticmethod
+    def _new_buckets(table_size):
+        return [EMPTY_ENTRY] * table_size
 
-        for i in range((len(item))):
-            return_value = 37 * (return_value) + ord(item[i])
+    @staticmethod
+    def _resolve_hash_function(hash_function):
+        if hash_function is None:
+            hash_function = HashQP.DEFAULT_HASH_FUNCTION
+        if callable(hash_function):
+            return hash_function
+        try:
+            return HASH_FUNCTIONS[hash_function]
+        except KeyError:
+            raise ValueError(f"Unknown hash function {hash_function!r}, "
+                             f"expected one of {sorted(HASH_FUNCTIONS)}")
 
-        if self.size == 0:
-            mysize = self.INIT_TABLE_SIZE
-        else:
-            mysize = self._table_size
-        return return_value % self._table_size
+    @property
+    def hash_function(self):
+        return self._hash_function
+
+    def _internal_hash(self, item):
+        return self._hash_function(item) % self._table_size
 
     def _next_prime(self, floor):
         # loop doesn't work for 2 or 3
@@ -71,53 +146,175 @@ class HashQP:
                         return candidate
             candidate += 2
 
-    def _find_pos(self, data):
+    # Probes buckets (the current table unless given) for data, comparing the
+    # hash cached in each entry before comparing the entries themselves.
+    def _find_pos(self, data, data_hash=None, buckets=None):
+        if data_hash is None:
+            data_hash = self._hash_function(data)
+        if buckets is None:
+            buckets = self._buckets
+        table_size = len(buckets)
         kth_odd_number = 1
-        bucket = self._internal_hash(data)
-        while self._buckets[bucket]._state != HashEntry.State.EMPTY and \
-                self._buckets[bucket]._data != data:
+        bucket = data_hash % table_size
+        while buckets[bucket]._state != HashEntry.State.EMPTY and \
+                (buckets[bucket]._hash != data_hash or
+                 buckets[bucket]._data != data):
             bucket += kth_odd_number
             kth_odd_number += 2
-            if bucket >= self._table_size:
-                bucket -= self._table_size
+            if bucket >= table_size:
+                bucket -= table_size
         return bucket
 
+    # Returns (buckets, bucket) for the active entry matching data, or
+    # (None, -1).  While the table is being rebuilt an entry may still be
+    # waiting in the old bucket list.
+    def _locate(self, data, data_hash=None):
+        if data_hash is None:
+            data_hash = self._hash_function(data)
+        bucket = self._find_pos(data, data_hash)
+        if self._buckets[bucket]._state == HashEntry.State.ACTIVE:
+            return self._buckets, bucket
+        if self._old_buckets is not None:
+            bucket = self._find_pos(data, data_hash, self._old_buckets)
+            if self._old_buckets[bucket]._state == HashEntry.State.ACTIVE:
+                return self._old_buckets, bucket
+        return None, -1
+
     def __contains__(self, data):
-        bucket = self._find_pos(data)
-        return self._buckets[bucket]._state == HashEntry.State.ACTIVE
+        return self._locate(data)[0] is not None
 
     def remove(self, data):
-        bucket = self._find_pos(data)
-        if self._buckets[bucket]._state != HashEntry.State.ACTIVE:
+        buckets, bucket = self._locate(data)
+        if buckets is None:
             return False
+        buckets[bucket]._state = HashEntry.State.DELETED
+        self._size -= 1
+        if self._old_buckets is not None:
+            self._migrate(HashQP.MIGRATE_STEP)
         else:
-            self._buckets[bucket]._state = HashEntry.State.DELETED
-            self._size -= 1
-            return True
+            new_size = self._shrunk_size()
+            if new_size is not None:
+                self._resize(new_size, self._incremental_rehash)
+        return True
 
     def insert(self, data):
-        bucket = self._find_pos(data.word)
+        data_hash = self._hash_function(data.word)
+        if self._old_buckets is not None:
+            bucket = self._find_pos(data.word, data_hash, self._old_buckets)
+            if self._old_buckets[bucket]._state == HashEntry.State.ACTIVE:
+                return False
+        bucket = self._find_pos(data.word, data_hash)
         if self._buckets[bucket]._state == HashEntry.State.ACTIVE:
             return False
         elif self._buckets[bucket]._state == HashEntry.State.EMPTY:
             self._load_size += 1
-        self._buckets[bucket]._data = data
-        self._buckets[bucket]._state = HashEntry.State.ACTIVE
+        entry = HashEntry(data)
+        entry._hash = data_hash
+        entry._state = HashEntry.State.ACTIVE
+        self._buckets[bucket] = entry
         self._size += 1
-        if self._load_size > self._max_lambda * self._table_size:
+        if self._old_buckets is not None:
+            self._migrate(HashQP.MIGRATE_STEP)
+        elif self._load_size > self._max_lambda * self._table_size:
             self._rehash()
         return True
 
+    # Tombstones count towards the load, so a table under churn fills up with
+    # them.  When they outnumber the live entries the table is rebuilt at the
+    # same size, which clears them without doubling the memory; otherwise it
+    # grows.
+    def _grown_size(self):
+        if self._load_size - self._size > self._size:
+            return self._table_size
+        return self._next_prime(2 * self._table_size)
+
+    def _shrunk_size(self):
+        if self._table_size <= HashQP.INIT_TABLE_SIZE or \
+                self._size >= self._min_lambda * self._table_size:
+            return None
+        return max(self._next_prime(self._table_size // 2),
+                   self._next_prime(HashQP.INIT_TABLE_SIZE))
+
     def _rehash(self):
-        old_table_size = self._table_size
-        self._table_size = self._next_prime(2 * old_table_size)
-        old_buckets = copy.copy(self._buckets)
-        self._buckets = [HashEntry() for _ in range(self._table_size)]
-        self._size = 0
+        new_size = self._grown_size()
+        if new_size == self._table_size:
+            incremental = self._incremental_compaction or \
+                self._incremental_rehash
+        else:
+            incremental = self._incremental_rehash
+        self._resize(new_size, incremental)
+
+    # Moves every active entry into a fresh bucket list of table_size.  With
+    # incremental set the old list is kept and drained MIGRATE_STEP buckets at
+    # a time by later inserts and removes (or compact_step()); lookups check
+    # both lists until it is empty.  A rebuild is always started with the
+    # live entries at most half the new table's max load, so MIGRATE_STEP
+    # buckets per insert drains the old list long before the new one fills.
+    def _resize(self, table_size, incremental=False):
+        if self._old_buckets is not None:
+            self._migrate(len(self._old_buckets))
+        old_buckets = self._buckets
+        self._table_size = table_size
+        self._buckets = self._new_buckets(table_size)
         self._load_size = 0
-        for k in range(old_table_size):
-            if old_buckets[k]._state == HashEntry.State.ACTIVE:
-                self.insert(old_buckets[k]._data)
+        self._old_buckets = old_buckets
+        self._migrate_pos = 0
+        if not incremental:
+            self._migrate(len(old_buckets))
+
+    # Entries are moved, cached hash and all, into the first free bucket of
+    # their probe sequence in the new table; no key is hashed or compared.
+    def _migrate(self, max_buckets):
+        old_buckets = self._old_buckets
+        end = min(self._migrate_pos + max_buckets, len(old_buckets))
+        buckets = self._buckets
+        table_size = self._table_size
+        for k in range(self._migrate_pos, end):
+            entry = old_buckets[k]
+            if entry._state != HashEntry.State.ACTIVE:
+                continue
+            kth_odd_number = 1
+            bucket = entry._hash % table_size
+            while buckets[bucket]._state == HashEntry.State.ACTIVE:
+                bucket += kth_odd_number
+                kth_odd_number += 2
+                if bucket >= table_size:
+                    bucket -= table_size
+            if buckets[bucket]._state == HashEntry.State.EMPTY:
+                self._load_size += 1
+            buckets[bucket] = entry
+        self._migrate_pos = end
+        if end == len(old_buckets):
+            self._old_buckets = None
+
+    # Clears every tombstone now by rebuilding the table at its current size.
+    def compact(self):
+        self._resize(self._table_size)
+
+    # Does a bounded amount of compaction work, for callers that want to keep
+    # the table tidy between operations (e.g. between the pages of a crawl).
+    # Starts an incremental same-size rebuild if tombstones outnumber live
+    # entries, then migrates up to max_buckets buckets.  Returns True while a
+    # rebuild is still in progress.
+    def compact_step(self, max_buckets=None):
+        if max_buckets is None:
+            max_buckets = HashQP.MIGRATE_STEP
+        if self._old_buckets is None:
+            if self.tombstones <= self._size:
+                return False
+            self._resize(self._table_size, incremental=True)
+        self._migrate(max_buckets)
+        return self._old_buckets is not None
+
+    # Deleted buckets still occupying the current table.  Only exact when no
+    # rebuild is in progress; during one it counts live entries that have not
+    # been migrated yet as well.
+    @property
+    def tombstones(self):
+        if self._old_buckets is not None:
+            return self._load_size - self._size + \
+                (len(self._old_buckets) - self._migrate_pos)
+        return self._load_size - self._size
 
     @property
     def size(self):
@@ -140,14 +337,193 @@ class HashQP:
         if max_lambda > 0:
             self._max_lambda = max_lambda
 
+    @property
+    def min_lambda(self):
+        return self._min_lambda
+
+    @min_lambda.setter
+    def min_lambda(self, min_lambda):
+        if 0 <= min_lambda < self._max_lambda / 2:
+            self._min_lambda = min_lambda
+
     def find(self, data):
         if type(data) is str:
             data = data.upper()
-        bucket = self._find_pos(data)
-        if self._buckets[bucket]._state != HashEntry.State.ACTIVE:
+        buckets, bucket = self._locate(data)
+        if buckets is None:
             raise HashQP.NotFoundError()
-        elif self._buckets[bucket]._data == data:
-            return self._buckets[bucket]._data
-        else:
+        return buckets[bucket]._data
+
+    # find() without the exception: default is returned on a miss.
+    def get(self, data, default=None):
+        if type(data) is str:
+            data = data.upper()
+        buckets, bucket = self._locate(data)
+        if buckets is None:
+            return default
+        return buckets[bucket]._data
+
+    def find_many(self, keys):
+        found = {}
+        for key in keys:
+            if type(key) is str:
+                key = key.upper()
+            buckets, bucket = self._locate(key)
+            if buckets is not None:
+                found[key] = buckets[bucket]._data
+        return found
+
+    # Calls function on every active entry, in bucket order, as the trees'
+    # traverse() does on every node.  Old buckets before _migrate_pos have
+    # already been moved to the current list.
+    def traverse(self, function):
+        if self._old_buckets is not None:
+            for k in range(self._migrate_pos, len(self._old_buckets)):
+                if self._old_buckets[k]._state == HashEntry.State.ACTIVE:
+                    function(self._old_buckets[k])
+        for entry in self._buckets:
+            if entry._state == HashEntry.State.ACTIVE:
+                function(entry)
+
+
+class CompactHashQP(HashQP):
+    # The same quadratic-probing table as HashQP, laid out as flat parallel
+    # arrays instead of one HashEntry object per bucket: a bytearray of
+    # states, an array of cached key hashes, and plain lists of keys and
+    # data.  A probe compares the cached hash before it compares keys, and
+    # _rehash() moves the stored hashes without hashing any key again.
+    # Stored data must have a .word, as with HashQP.insert().
+
+    ACTIVE = HashEntry.State.ACTIVE.value
+    EMPTY = HashEntry.State.EMPTY.value
+    DELETED = HashEntry.State.DELETED.value
+
+    def __init__(self, table_size=None, hash_function=None):
+        super().__init__(table_size, hash_function)
+        # The arrays below take the place of HashQP's bucket list.
+        self._buckets = None
+        self._allocate(self._table_size)
+
+    def _allocate(self, table_size):
+        self._states = bytearray([CompactHashQP.EMPTY]) * table_size
+        self._hashes = array('q', [0]) * table_size
+        self._keys = [None] * table_size
+        self._values = [None] * table_size
+
+    def _find_pos(self, key, key_hash):
+        states = self._states
+        hashes = self._hashes
+        keys = self._keys
+        kth_odd_number = 1
+        bucket = key_hash % self._table_size
+        while states[bucket] != CompactHashQP.EMPTY and \
+                (hashes[bucket] != key_hash or keys[bucket] != key):
+            bucket += kth_odd_number
+            kth_odd_number += 2
+            if bucket >= self._table_size:
+                bucket -= self._table_size
+        return bucket
+
+    def _lookup(self, key):
+        if type(key) is str:
+            key = key.upper()
+        bucket = self._find_pos(key, self._hash_function(key))
+        if self._states[bucket] != CompactHashQP.ACTIVE:
+            return -1
+        return bucket
+
+    def __contains__(self, data):
+        return self._lookup(data) >= 0
+
+    def remove(self, data):
+        bucket = self._lookup(data)
+        if bucket < 0:
+            return False
+        self._states[bucket] = CompactHashQP.DELETED
+        self._values[bucket] = None
+        self._size -= 1
+        new_size = self._shrunk_size()
+        if new_size is not None:
+            self._rehash(new_size)
+        return True
+
+    def insert(self, data):
+        key = data.word
+        key_hash = self._hash_function(key)
+        bucket = self._find_pos(key, key_hash)
+        state = self._states[bucket]
+        if state == CompactHashQP.ACTIVE:
+            return False
+        elif state == CompactHashQP.EMPTY:
+            self._load_size += 1
+        self._states[bucket] = CompactHashQP.ACTIVE
+        self._hashes[bucket] = key_hash
+        self._keys[bucket] = key
+        self._values[bucket] = data
+        self._size += 1
+        if self._load_size > self._max_lambda * self._table_size:
+            self._rehash(self._grown_size())
+        return True
+
+    # Keys are unique and the new table has no tombstones, so each entry
+    # just takes the first empty bucket on its probe sequence.
+    def _rehash(self, table_size):
+        old_table_size = self._table_size
+        old_states, old_hashes = self._states, self._hashes
+        old_keys, old_values = self._keys, self._values
+        self._table_size = table_size
+        self._allocate(self._table_size)
+        states = self._states
+        for k in range(old_table_size):
+            if old_states[k] != CompactHashQP.ACTIVE:
+                continue
+            key_hash = old_hashes[k]
+            kth_odd_number = 1
+            bucket = key_hash % self._table_size
+            while states[bucket] != CompactHashQP.EMPTY:
+                bucket += kth_odd_number
+                kth_odd_number += 2
+                if bucket >= self._table_size:
+                    bucket -= self._table_size
+            states[bucket] = CompactHashQP.ACTIVE
+            self._hashes[bucket] = key_hash
+            self._keys[bucket] = old_keys[k]
+            self._values[bucket] = old_values[k]
+        self._load_size = self._size
+
+    def compact(self):
+        self._rehash(self._table_size)
+
+    # The flat layout has no incremental rebuild, so a step that finds the
+    # table mostly tombstones compacts all of it.
+    def compact_step(self, max_buckets=None):
+        if self.tombstones > self._size:
+            self.compact()
+        return False
+
+    def find(self, data):
+        bucket = self._lookup(data)
+        if bucket < 0:
             raise HashQP.NotFoundError()
+        return self._values[bucket]
+
+    def get(self, data, default=None):
+        bucket = self._lookup(data)
+        if bucket < 0:
+            return default
+        return self._values[bucket]
+
+    def find_many(self, keys):
+        found = {}
+        for key in keys:
+            if type(key) is str:
+                key = key.upper()
+            bucket = self._find_pos(key, self._hash_function(key))
+            if self._states[bucket] == CompactHashQP.ACTIVE:
+                found[key] = self._values[bucket]
+        return found
 
+    def traverse(self, function):
+        for k in range(self._table_size):
+            if self._states[k] == CompactHashQP.ACTIVE:
+                function(HashEntry(self._values[k]))
@@ -0,0 +1,356 @@
+import mmap
+import struct
+import sys
+from array import array
+
+from postings import PostingsList
+
+# On-disk index layout, all integers little-endian:
+#
+#   header      magic, version, document count, term count and the offsets
+#               of the six sections below
+#   urls        (documents + 1) u64 offsets into the url blob, then the blob
+#   postings    every term's PostingsList.to_bytes(), back to back
+#   terms       (terms + 1) u64 offsets into the term blob, then the blob;
+#               terms are upper case and sorted
+#   dictionary  per term: u64 postings offset, u32 postings length,
+#               u32 document count
+#   lengths     per document: u32 count of its indexed words, for ranking
+#   records     only in an index saved by an incremental WebStore, offset 0
+#               otherwise: (documents + 1) u64 offsets into a blob of crawl
+#               records, one per document and empty if it has none.  A
+#               record is a u32 string count, then each string as a u32
+#               length and UTF-8: ETag, Last-Modified, hex body digest and
+#               the page's hrefs.
+#
+# Postings are written before the terms so save() can stream them out.
+
+MAGIC = b"WSIX"
+VERSION = 3
+_HEADER = struct.Struct("<4sIIIQQQQQQ")
+_OFFSET = struct.Struct("<Q")
+_DICT_ENTRY = struct.Struct("<QII")
+_LENGTH = struct.Struct("<I")
+
+
+def _write_blob_table(out, blobs):
+    offset = 0
+    for blob in blobs:
+        out.write(_OFFSET.pack(offset))
+        offset += len(blob)
+    out.write(_OFFSET.pack(offset))
+    for blob in blobs:
+        out.write(blob)
+
+
+def _write_string_table(out, strings):
+    _write_blob_table(out, [string.encode() for string in strings])
+
+
+# record is (etag, last_modified, digest, hrefs), or None.
+def _pack_record(record):
+    if record is None:
+        return b""
+    etag, last_modified, digest, hrefs = record
+    strings = [etag or "", last_modified or "", digest.hex()] + list(hrefs)
+    out = bytearray(_LENGTH.pack(len(strings)))
+    for string in strings:
+        blob = string.encode()
+        out += _LENGTH.pack(len(blob))
+        out += blob
+    return bytes(out)
+
+
+def _unpack_record(data):
+    if not data:
+        return None
+    (count,) = _LENGTH.unpack_from(data, 0)
+    pos = _LENGTH.size
+    strings = []
+    for _ in range(count):
+        (length,) = _LENGTH.unpack_from(data, pos)
+        pos += _LENGTH.size
+        strings.append(data[pos:pos + length].decode())
+        pos += length
+    etag, last_modified, digest = strings[:3]
+    return (etag or None, last_modified or None, bytes.fromhex(digest),
+            strings[3:])
+
+
+# entries is an iterable of (word, PostingsList) in sorted word order, and
+# lengths an array('I') of each document's indexed word count.  records, if
+# given, has a crawl record (see _pack_record()) or None for each url.
+def write_index(path, urls, entries, lengths, records=None):
+    with open(path, "wb") as out:
+        out.write(bytes(_HEADER.size))
+        urls_offset = out.tell()
+        _write_string_table(out, urls)
+        postings_offset = out.tell()
+        terms = []
+        dictionary = []
+        for word, postings in entries:
+            data = postings.to_bytes()
+            terms.append(word)
+            dictionary.append((out.tell() - postings_offset, len(data),
+                               len(postings)))
+            out.write(data)
+        terms_offset = out.tell()
+        _write_string_table(out, terms)
+        dictionary_offset = out.tell()
+        for entry in dictionary:
+            out.write(_DICT_ENTRY.pack(*entry))
+        lengths_offset = out.tell()
+        lengths = array('I', lengths)
+        if sys.byteorder == "big":
+            lengths.byteswap()
+        out.write(lengths.tobytes())
+        records_offset = 0
+        if records is not None:
+            records_offset = out.tell()
+            _write_blob_table(out, [_pack_record(record)
+                                    for record in records])
+        out.seek(0)
+        out.write(_HEADER.pack(MAGIC, VERSION, len(urls), len(terms),
+                               urls_offset, postings_offset, terms_offset,
+                               dictionary_offset, lengths_offset,
+                               records_offset))
+
+
+class IndexFile:
+    # A memory-mapped index written by write_index().  Opening it only reads
+    # the header; urls, terms and postings are decoded when asked for.
+
+    class FormatError(Exception):
+        pass
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            (magic, version, self._num_docs, self._num_terms,
+             self._urls_offset, self._postings_offset, self._terms_offset,
+             self._dictionary_offset, self._lengths_offset,
+             self._records_offset) = \
+                _HEADER.unpack_from(self._map, 0)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise IndexFile.FormatError(f"{path} is not an index file")
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise IndexFile.FormatError(f"{path} is not a version {VERSION} "
+                                        f"index file")
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    @property
+    def num_docs(self):
+        return self._num_docs
+
+    @property
+    def num_terms(self):
+        return self._num_terms
+
+    def _blob(self, table_offset, count, index):
+        start, end = struct.unpack_from(
+            "<QQ", self._map, table_offset + index * _OFFSET.size)
+        blob = table_offset + (count + 1) * _OFFSET.size
+        return self._map[blob + start:blob + end]
+
+    def _string(self, table_offset, count, index):
+        return self._blob(table_offset, count, index).decode()
+
+    def url(self, doc_id):
+        if not 0 <= doc_id < self._num_docs:
+            raise IndexError(doc_id)
+        return self._string(self._urls_offset, self._num_docs, doc_id)
+
+    def urls(self):
+        return [self.url(doc_id) for doc_id in range(self._num_docs)]
+
+    # Every document's indexed word count, read in one go.
+    def lengths(self):
+        lengths = array('I')
+        lengths.frombytes(self._map[self._lengths_offset:self._lengths_offset
+                                    + 4 * self._num_docs])
+        if sys.byteorder == "big":
+            lengths.byteswap()
+        return lengths
+
+    # The document's crawl record as (etag, last_modified, digest, hrefs),
+    # or None.
+    def record(self, doc_id):
+        if not 0 <= doc_id < self._num_docs:
+            raise IndexError(doc_id)
+        if not self._records_offset:
+            return None
+        return _unpack_record(self._blob(self._records_offset, self._num_docs,
+                                         doc_id))
+
+    def term(self, index):
+        return self._string(self._terms_offset, self._num_terms, index)
+
+    # Binary search of the sorted term table for the first term >= word.
+    def lower_bound(self, word):
+        low, high = 0, self._num_terms
+        while low < high:
+            mid = (low + high) // 2
+            if self.term(mid) < word:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    # Returns the term's index or -1.
+    def find_term(self, word):
+        index = self.lower_bound(word)
+        if index < self._num_terms and self.term(index) == word:
+            return index
+        return -1
+
+    def doc_count(self, index):
+        return _DICT_ENTRY.unpack_from(
+            self._map, self._dictionary_offset + index * _DICT_ENTRY.size)[2]
+
+    def postings(self, index):
+        offset, length, _ = _DICT_ENTRY.unpack_from(
+            self._map, self._dictionary_offset + index * _DICT_ENTRY.size)
+        start = self._postings_offset + offset
+        return PostingsList.from_bytes(self._map[start:start + length])
+
+
+class MappedDocumentTable:
+    # Read-only DocumentTable over an IndexFile's url table.  The url -> id
+    # map is only built the first time it is needed.
+
+    def __init__(self, index):
+        self._index = index
+        self._ids = None
+
+    def id_of(self, url):
+        if self._ids is None:
+            self._ids = {self._index.url(doc_id): doc_id
+                         for doc_id in range(len(self))}
+        return self._ids.get(url)
+
+    def url(self, doc_id):
+        return self._index.url(doc_id)
+
+    def urls(self):
+        return self._index.urls()
+
+    def __len__(self):
+        return self._index.num_docs
+
+    def __contains__(self, url):
+        return self.id_of(url) is not None
+
+    def intern(self, url):
+        raise MappedKeywords.ReadOnlyError(
+            "A memory-mapped index cannot be added to")
+
+
+class _Node:
+
+    def __init__(self, data):
+        self.data = data
+
+
+class MappedKeywords:
+    # Read-only stand-in for a WebStore backing store, answering find() from
+    # an IndexFile.  entry(word, postings) builds what find() returns, so the
+    # keyword objects stay the caller's business; postings are decoded per
+    # lookup and not kept.  With keep set, only the terms for which
+    # keep(term) is true are visible, so one file can back several shards.
+
+    class NotFoundError(Exception):
+        pass
+
+    class ReadOnlyError(Exception):
+        pass
+
+    def __init__(self, index, entry, keep=None):
+        self._index = index
+        self._entry = entry
+        self._keep = keep
+        self._size = None if keep is not None else index.num_terms
+
+    # Counting the terms a keep function selects reads the whole term
+    # table, so it is only done when asked for.
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = sum(1 for index in range(self._index.num_terms)
+                             if self._keep(self._index.term(index)))
+        return self._size
+
+    # The term's index, or -1 if it is missing or not visible here.
+    def _find_term(self, key):
+        if self._keep is not None and not self._keep(key):
+            return -1
+        return self._index.find_term(key)
+
+    def find(self, key: str):
+        key = key.upper()
+        index = self._find_term(key)
+        if index < 0:
+            raise MappedKeywords.NotFoundError
+        return self._entry(key, self._index.postings(index))
+
+    def get(self, key: str, default=None):
+        key = key.upper()
+        index = self._find_term(key)
+        if index < 0:
+            return default
+        return self._entry(key, self._index.postings(index))
+
+    def find_many(self, keys):
+        found = {}
+        for key in keys:
+            key = key.upper()
+            index = self._find_term(key)
+            if index >= 0:
+                found[key] = self._entry(key, self._index.postings(index))
+        return found
+
+    def __contains__(self, key):
+        return self._find_term(key.upper()) >= 0
+
+    def traverse(self, function):
+        for index in range(self._index.num_terms):
+            term = self._index.term(index)
+            if self._keep is None or self._keep(term):
+                function(_Node(self._entry(term,
+                                           self._index.postings(index))))
+
+    # The same lazy, ordered iteration as BinarySearchTree.range() and
+    # prefix(), over the sorted term table.
+    def range(self, low=None, high=None):
+        index = 0 if low is None else self._index.lower_bound(low.upper())
+        if high is not None:
+            high = high.upper()
+        while index < self._index.num_terms:
+            term = self._index.term(index)
+            if high is not None and term >= high:
+                return
+            if self._keep is None or self._keep(term):
+                yield self._entry(term, self._index.postings(index))
+            index += 1
+
+    def prefix(self, prefix):
+        prefix = prefix.upper()
+        if not prefix:
+            return self.range()
+        return self.range(prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+    def insert(self, data):
+        raise MappedKeywords.ReadOnlyError(
+            "A memory-mapped index cannot be added to")
+
+    def remove(self, data):
+        raise MappedKeywords.ReadOnlyError(
+            "A memory-mapped index cannot be changed")
@@ -1,612 +1,60 @@
-from bs4 import BeautifulSoup
 import timeit
 from random_words import RandomWords
-import requests
-import re
-from bs4.element import Comment
-from urllib.parse import urljoin
-import copy
-import math
-from enum import Enum
 import random
-
-
-class BinaryTreeNode:
-
-    def __init__(self, data):
-        self.data = data
-        self.left_child = None
-        self.right_child = None
-
-
-class BinarySearchTree:
-    class NotFoundError(Exception):
-        pass
-
-    class EmptyTreeError(Exception):
-        pass
-
-    def __init__(self):
-        self._root = None
-        self._size = 0
-
-    @property
-    def size(self):
-        return self._size
-
-    def find(self, key: str):
-        return self._find(key.upper(), self._root)
-
-    def _find(self, key, sub_root):
-        if sub_root is None:
-            raise BinarySearchTree.NotFoundError
-        if key < sub_root.data:
-            return self._find(key, sub_root.left_child)
-        elif sub_root.data < key:
-            return self._find(key, sub_root.right_child)
-        else:
-            return sub_root.data
-
-    def __contains__(self, key):
-        try:
-            self.find(key)
-            return True
-        except self.NotFoundError:
-            return False
-
-    def insert(self, data):
-        old_size = self._size
-        self._root = self._insert(data, self._root)
-        return old_size != self._size
-
-    def _insert(self, data, sub_root):
-        if sub_root is None:
-            self._size += 1
-            return BinaryTreeNode(data)
-        if data < sub_root.data:
-            sub_root.left_child = self._insert(data, sub_root.left_child)
-        elif sub_root.data < data:
-            sub_root.right_child = self._insert(data, sub_root.right_child)
-        return sub_root
-
-    def remove(self, data):
-        self._root = self._remove(data, self._root)
-
-    def _remove(self, data, sub_root):
-        if sub_root is None:
-            raise BinarySearchTree.NotFoundError
-        if data < sub_root.data:
-            sub_root.left_child = self._remove(data, sub_root.left_child)
-        elif sub_root.data < data:
-            sub_root.right_child = self._remove(data, sub_root.right_child)
-
-        elif sub_root.left_child is not None \
-                and sub_root.right_child is not None:
-            sub_root.data = self._find_min(sub_root.right_child)
-            sub_root.right_child = \
-                self._remove(sub_root.data, sub_root.right_child)
-        else:
-            sub_root = sub_root.left_child if sub_root.left_child is not None \
-                else sub_root.right_child
-            self._size -= 1
-        return sub_root
-
-    def find_min(self):
-        if self._root is None:
-            raise BinarySearchTree.EmptyTreeError
-        return self._find_min(self._root)
-
-    def _find_min(self, sub_root):
-        if sub_root.left_child is None:
-            return sub_root.data
-        else:
-            return self._find_min(sub_root.left_child)
-
-    def find_max(self):
-        if self._root is None:
-            raise BinarySearchTree.EmptyTreeError
-        return self._find_max(self._root)
-
-    def _find_max(self, sub_root):
-        if sub_root.right_child is None:
-            return sub_root.data
-        else:
-            return self._find_max(sub_root.right_child)
-
-    def traverse(self, function):
-        self._traverse(function, self._root)
-
-    def _traverse(self, function, sub_root):
-        if sub_root is None:
-            return
-        if sub_root.left_child is not None:
-            self._traverse(function, sub_root.left_child)
-        function(sub_root)
-        if sub_root.right_child is not None:
-            self._traverse(function, sub_root.right_child)
-
-class SplayTree(BinarySearchTree):
-    def __init__(self):
-        super().__init__()
-
-    def insert(self, data):
-        if self._root is None:
-            self._root = BinaryTreeNode(data)
-            self._size += 1
-            return True
-        self._root = self._splay(data)
-        if data < self._root.data:
-            new_node = BinaryTreeNode(data)
-            new_node.left_child = self._root.left_child
-            new_node.right_child = self._root
-            self._root.left_child = None
-            self._root = new_node
-            self._size += 1
-            return True
-        elif data > self._root.data:
-            new_node = BinaryTreeNode(data)
-            new_node.left_child = self._root
-            new_node.right_child = self._root.right_child
-            self._root.right_child = None
-            self._root = new_node
-            self._size += 1
-            return True
-        else:
-            return False
-
-    def remove(self, data):
-        if self._root is None:
-            return False
-        self._root = self._splay(data)
-        if data != self._root.data:
-            return False
-        if self._root.left_child is None:
-            new_root = self._root.right_child
-        else:
-            new_root = self._root.left_child
-            new_root = self._splay(data, new_root)
-            new_root.right_child = self._root.right_child
-        self._root = new_root
-        self._size -= 1
-        return True
-
-    def __contains__(self, data):
-        try:
-            self.find(data)
-            return True
-        except self.NotFoundError:
-            return False
-
-    def find(self, data):
-        if self._root is None:
-            raise BinarySearchTree.NotFoundError
-        self._root = self._splay(data)
-        if self._root.data != data:
-            raise BinarySearchTree.NotFoundError
-        else:
-            return self._root.data
-
-    def show_root(self):
-        if self._root is not None:
-            return self._root.data
-
-    def print_tree(self, sub_root=None):
-        if sub_root is None:
-            if self._root is None:
-                return
-            else:
-                sub_root = self._root
-        self._print_tree(sub_root, 0)
-
-    def _print_tree(self, sub_root, depth):
-        if sub_root is None:
-            return
-        for _ in range(depth):
-            print("-", end="")
-        print(sub_root.data)
-        print("L")
-        self._print_tree(sub_root.left_child, depth + 1)
-        print("R")
-        self._print_tree(sub_root.right_child, depth + 1)
-
-    def _splay(self, data, sub_root=None):
-        if sub_root is None:
-            sub_root = self._root
-        right_tree = None
-        left_tree = None
-        right_tree_min = None
-        left_tree_max = None
-
-        while sub_root.data != data:
-            if data < sub_root.data:
-                if sub_root.left_child is None:
-                    break
-                if data < sub_root.left_child.data:
-                    sub_root = self._right_rotation(sub_root)
-                    # sub_root = self._root
-                    if sub_root.left_child is None:
-                        break
-                if right_tree is None:
-                    right_tree = sub_root
-                    right_tree_min = sub_root
-                else:
-                    # Specifically, it will be placed to the left of R's minimum node
-                    right_tree_min.left_child = sub_root
-                    right_tree_min = sub_root
-                sub_root = sub_root.left_child
-            elif data > sub_root.data:
-                if sub_root.right_child is None:
-                    break
-                if data > sub_root.right_child.data:
-                    sub_root = self._left_rotation(sub_root)
-                    # sub_root = self._root
-                    if sub_root.right_child is None:
-                        break
-                if left_tree is None:
-                    left_tree = sub_root
-                    left_tree_max = sub_root
-                else:
-                    # Feels infinite loopy
-                    left_tree_max.right_child = sub_root
-                    left_tree_max = sub_root
-                sub_root = sub_root.right_child
-            else:
-                break
-
-        if left_tree is not None:
-            left_tree_max.right_child = sub_root.left_child
-            sub_root.left_child = left_tree
-        if right_tree is not None:
-            right_tree_min.left_child = sub_root.right_child
-            sub_root.right_child = right_tree
-
-        return sub_root
-
-    def _right_rotation(self, sub_root):
-        # Identify the new sub_root and save to a temporary variable
-        new_sub_root = sub_root.left_child
-
-        # Move the node that would otherwise become the "middle node" to its new
-        # position on the left side of the tree
-        # Thus maneuver also makes space for the old sub_root
-        sub_root.left_child = new_sub_root.right_child
-
-        # Move the old sub_root to its position on the right of the new sub_root
-        new_sub_root.right_child = sub_root
-
-        return new_sub_root
-
-    def _left_rotation(self, sub_root):
-        # Identify the new sub_root and save to a temporary variable
-        new_sub_root = sub_root.right_child
-
-        # Move the node that would otherwise become the "middle node" to its new
-        # position on the right side of the tree
-        # Thus maneuver also makes space for the old sub_root
-        sub_root.right_child = new_sub_root.left_child
-
-        # Move the old sub_root to its position on the left of the new sub_root
-        new_sub_root.left_child = sub_root
-
-        return new_sub_root
-
-
-class AVLTreeNode(BinaryTreeNode):
-
-    def __init__(self, data):
-        self.height = 0
-        super().__init__(data)
-
-    def calc_height(self):
-        self.height = max(self.child_heights) + 1
-
-    @property
-    def child_heights(self):
-        if self.left_child is None:
-            left_height = -1
-        else:
-            left_height = self.left_child.height
-        if self.right_child is None:
-            right_height = -1
-        else:
-            right_height = self.right_child.height
-        return left_height, right_height
-
-
-class AVLTree(BinarySearchTree):
-
-    def calc_heights_after_rotation(self, new_sub_root):
-        if new_sub_root.left_child is not None:
-            new_sub_root.left_child.calc_height()
-        if new_sub_root.right_child is not None:
-            new_sub_root.right_child.calc_height()
-        new_sub_root.calc_height()
-
-    def right_rotation(self, sub_root):
-        new_sub_root = sub_root.left_child
-        tempR = new_sub_root.right_child
-        new_sub_root.right_child = sub_root
-        sub_root.left_child = tempR
-        sub_root.calc_height()
-        new_sub_root.calc_height()
-        return new_sub_root
-
-    def left_rotation(self, sub_root):
-        new_sub_root = sub_root.right_child
-        tempL = new_sub_root.left_child
-        new_sub_root.left_child = sub_root
-        sub_root.right_child = tempL
-        sub_root.calc_height()
-        new_sub_root.calc_height()
-        return new_sub_root
-
-    def _insert(self, data, sub_root):
-        if sub_root is None:
-            self._size += 1
-            return AVLTreeNode(data)
-        sub_root = super()._insert(data, sub_root)
-        sub_root = self._rotate_if_needed(sub_root)
-        return sub_root
-
-    def _remove(self, data, sub_root):
-        sub_root = super()._remove(data, sub_root)
-        sub_root = self._rotate_if_needed(sub_root)
-        return sub_root
-
-    def _rotate_if_needed(self, node):
-        if node is None:
-            return node
-        node.calc_height()
-        (left_height, right_height) = node.child_heights
-        if left_height - right_height > 1:
-            # Right Rotation Needed
-            if node.left_child is not None:
-                (left_height, right_height) = \
-                    node.left_child.child_heights
-                if right_height - left_height > 0:
-                    # Left Right Rotation Needed
-                    node.left_child = self.left_rotation(node.left_child)
-            node = self.right_rotation(node)
-        elif right_height - left_height > 1:
-            # Right Rotation Needed
-            if node.right_child is not None:
-                (left_height, right_height) = \
-                    node.right_child.child_heights
-                if left_height - right_height > 0:
-                    # Right Left Rotation Needed
-                    node.right_child = self.right_rotation(node.right_child)
-            node = self.left_rotation(node)
-        return node
-
-    def print_tree(self, sub_root=None):
-        if sub_root is None:
-            if self._root is None:
-                return
-            else:
-                sub_root = self._root
-        self._print_tree(sub_root, 0)
-
-    def _print_tree(self, sub_root, depth):
-        if sub_root is None:
-            return
-        for _ in range(depth):
-            print("-", end="")
-        print(sub_root.data)
-        print("L")
-        self._print_tree(sub_root.left_child, depth + 1)
-        print("R")
-        self._print_tree(sub_root.right_child, depth + 1)
-
-
-def check_AVL_cond(sub_root):
-    if sub_root is not None:
-        (left, right) = sub_root.child_heights
-        if abs(left - right) > 1:
-            print("AVL Violated")
-        if sub_root.left_child is not None:
-            check_AVL_cond(sub_root.left_child)
-        if sub_root.right_child is not None:
-            check_AVL_cond(sub_root.right_child)
-
-class HashEntry:
-    class State(Enum):
-        ACTIVE = 0
-        EMPTY = 1
-        DELETED = 2
-
-    def __init__(self, data=None):
-        self._data = data
-        self._state = HashEntry.State.EMPTY
-
-    @property
-    def data(self):
-        return self._data
-
-class HashQP:
-    class NotFoundError(Exception):
-        pass
-
-    INIT_TABLE_SIZE = 97
-    INIT_MAX_LAMBDA = .49
-
-    def __init__(self, table_size=None):
-
-        self._sites = None
-        if table_size is None or table_size < HashQP.INIT_TABLE_SIZE:
-            self._table_size = self._next_prime(HashQP.INIT_TABLE_SIZE)
-        else:
-            self._table_size = self._next_prime(table_size)
-        self._buckets = [HashEntry() for _ in range(self._table_size)]
-        self._max_lambda = HashQP.INIT_MAX_LAMBDA
-        self._size = 0
-        self._load_size = 0
-
-    def _internal_hash(self, item):
-        return hash(item) % self._table_size
-
-    def _next_prime(self, floor):
-        # loop doesn't work for 2 or 3
-        if floor <= 2:
-            return 2
-        elif floor == 3:
-            return 3
-        if floor % 2 == 0:
-            candidate = floor + 1
-        else:
-            candidate = floor
-
-        while True:
-            # we know candidate is odd.  check for divisibility by 3
-            if candidate % 3 != 0:
-                loop_lim = int((math.sqrt(candidate) + 1) / 6)
-                # now we can check for divisibility by 6k +/- 1 up to sqrt
-                for k in range(1, loop_lim + 1):
-                    if candidate % (6 * k - 1) == 0:
-                        break
-                    if candidate % (6 * k + 1) == 0:
-                        break
-                    if k == loop_lim:
-                        return candidate
-            candidate += 2
-
-    def _find_pos(self, data):
-        kth_odd_number = 1
-        bucket = self._internal_hash(data)
-        while self._buckets[bucket]._state != HashEntry.State.EMPTY and \
-                self._buckets[bucket]._data != data:
-            bucket += kth_odd_number
-            kth_odd_number += 2
-            if bucket >= self._table_size:
-                bucket -= self._table_size
-        return bucket
-
-    def __contains__(self, data):
-        bucket = self._find_pos(data)
-        return self._buckets[bucket]._state == HashEntry.State.ACTIVE
-
-    def remove(self, data):
-        bucket = self._find_pos(data)
-        if self._buckets[bucket]._state != HashEntry.State.ACTIVE:
-            return False
-        else:
-            self._buckets[bucket]._state = HashEntry.State.DELETED
-            self._size -= 1
-            return True
-
-    def insert(self, data):
-        bucket = self._find_pos(data.word)
-        if self._buckets[bucket]._state == HashEntry.State.ACTIVE:
-            return False
-        elif self._buckets[bucket]._state == HashEntry.State.EMPTY:
-            self._load_size += 1
-        self._buckets[bucket]._data = data
-        self._buckets[bucket]._state = HashEntry.State.ACTIVE
-        self._size += 1
-        if self._load_size > self._max_lambda * self._table_size:
-            self._rehash()
-        return True
-
-    def _rehash(self):
-        old_table_size = self._table_size
-        self._table_size = self._next_prime(2 * old_table_size)
-        old_buckets = copy.copy(self._buckets)
-        self._buckets = [HashEntry() for _ in range(self._table_size)]
-        self._size = 0
-        self._load_size = 0
-        for k in range(old_table_size):
-            if old_buckets[k]._state == HashEntry.State.ACTIVE:
-                self.insert(old_buckets[k]._data)
-
-    @property
-    def size(self):
-        return self._size
-
-    @property
-    def max_lambda(self):
-        return self._max_lambda
-
-    @property
-    def data(self):
-        return self.data
-
-    @property
-    def sites(self):
-        return self._sites
-
-    @max_lambda.setter
-    def max_lambda(self, max_lambda):
-        if max_lambda > 0:
-            self._max_lambda = max_lambda
-
-    def find(self, data):
-        if type(data) is str:
-            data = data.upper()
-        bucket = self._find_pos(data)
-        if self._buckets[bucket]._state != HashEntry.State.ACTIVE:
-            raise HashQP.NotFoundError()
-        elif self._buckets[bucket]._data == data:
-            return self._buckets[bucket]._data
-        else:
-            raise HashQP.NotFoundError()
-
-
-def text_harvester(url):
-    headers = {
-        'User-Agent': ''}
-    try:
-        page = requests.get(url, headers=headers)
-    except:
-        return []
-    res = words_from_html(page.content)
-
-    return res
-
-
-def link_fisher(url, depth=0, reg_ex=""):
-    res = _link_fisher(url, depth, reg_ex)
-    res.append(url)
-    return list(set(res))
-
-
-def _link_fisher(url, depth, reg_ex):
-    link_list = []
-    if depth == 0:
-        return link_list
-    headers = {
-        'User-Agent': ''}
-    try:
-        page = requests.get(url, headers=headers)
-    except:
-        print("Cannot retrieve", url)
-        return link_list
-    data = page.text
-    soup = BeautifulSoup(data, features="html.parser")
-    for link in soup.find_all('a', attrs={'href': re.compile(reg_ex)}):
-        link_list.append(urljoin(url, link.get('href')))
-    for i in range(len(link_list)):
-        link_list.extend(_link_fisher(link_list[i], depth - 1, reg_ex))
-    return link_list
+import heapq
+import re
+from array import array
+from itertools import islice
+from BST import BinarySearchTree
+from hash_table import HashQP, CompactHashQP
+from splay_tree import SplayTree
+from AVL_tree import AVLTree
+from crawler import PageRecord, harvest
+from postings import DocumentTable, PostingsList
+from query import QueryEngine
+from ranking import BM25
+from query_cache import QueryCache
+from bloom_filter import BloomFilter
+from index_file import IndexFile, MappedDocumentTable, MappedKeywords, \
+    write_index
 
 
 class KeywordEntry:
-    def __init__(self, word: str, url: str = None, location: int = None):
+    # Every WebStore passes its own DocumentTable so that document ids are
+    # local to an index.  An entry built without one gets a private table,
+    # created when its first url is added.
+
+    def __init__(self, word: str, url: str = None, location: int = None,
+                 documents: DocumentTable = None):
         self._word = word.upper()
+        self._documents = documents
+        self._postings = PostingsList()
         if url:
-            self._sites = {url: [location]}
-        else:
-            self._sites = {}
+            self.add(url, location)
+
+    @classmethod
+    def from_postings(cls, word: str, postings: PostingsList,
+                      documents: DocumentTable):
+        entry = cls(word, documents=documents)
+        entry._postings = postings
+        return entry
 
     def add(self, url: str, location: int) -> None:
-        if url in self._sites:
-            self._sites[url].append(location)
-        else:
-            self._sites[url] = [location]
+        if self._documents is None:
+            self._documents = DocumentTable()
+        self._postings.add(self._documents.intern(url), location)
 
     def get_locations(self, url: str) -> list:
-        try:
-            return self._sites[url]
-        except IndexError:
+        if self._documents is None:
+            return []
+        doc_id = self._documents.id_of(url)
+        if doc_id is None:
             return []
+        return self._postings.positions(doc_id)
+
+    @property
+    def postings(self) -> PostingsList:
+        return self._postings
 
     @property
     def word(self):
@@ -614,7 +62,10 @@ class KeywordEntry:
 
     @property
     def sites(self) -> list:
-        return [key for key in self._sites]
+        if self._documents is None:
+            return []
+        url = self._documents.url
+        return [url(doc_id) for doc_id in self._postings.doc_ids]
 
     def __eq__(self, other):
         if type(other) is KeywordEntry:
@@ -640,30 +91,366 @@ class KeywordEntry:
 
 class WebStore(Exception):
     NotFoundError = None
+    MIN_FILTER_CAPACITY = 1024
+
+    # With bulk_load set, crawl() collects the new keywords of a crawl and
+    # loads them into the backing store in one sorted pass when the crawl
+    # ends (from_sorted() on the trees), instead of inserting them one at a
+    # time.  Words first seen during a bulk crawl are not searchable until it
+    # has finished.
+    # With incremental set, the store remembers every page it has indexed
+    # (see crawler.PageRecord) and which keywords it holds.  Re-crawling then
+    # sends conditional requests, skips pages that have not changed, and
+    # re-indexes a changed page by replacing only that document's postings.
+    # A page that has gone (a 404 or 410) is removed from the index; one that
+    # fails any other way is left as it was.  save() keeps the crawl records
+    # with the index, and load(incremental=True) brings them back.
+    # fetcher is the fetcher.Fetcher crawls use, the shared one by default.
+    # parse_workers and parse_batch configure the crawler's process-pool
+    # parse stage (see crawler.Crawler); pages are parsed in the fetch
+    # threads unless parse_workers is set.
+    # cache_size, if set, keeps the results of that many keyword searches
+    # (see set_cache()); bloom_error_rate, if set, puts a Bloom filter of
+    # the stored keywords in front of the backing store (see
+    # set_bloom_filter()).
+    # store_options are passed to ds() as keyword arguments, e.g.
+    # {"incremental_compaction": True} for HashQP.  An incremental crawl
+    # gives the backing store a compact_step() between pages, where it has
+    # one, to clear the tombstones that re-indexing leaves behind.
+    def __init__(self, ds, bulk_load=False, incremental=False, fetcher=None,
+                 parse_workers=None, parse_batch=None, cache_size=None,
+                 bloom_error_rate=None, store_options=None):
+        self._store = self._wrap_store(ds(**(store_options or {})))
+        self._fetcher = fetcher
+        self._parse_workers = parse_workers
+        self._parse_batch = parse_batch
+        self._documents = DocumentTable()
+        self._bulk_load = bulk_load
+        self._pending = {}
+        self._incremental = incremental
+        self._records = {} if incremental else None
+        self._page_keys = {}
+        # Indexed words per doc id, and their total, for ranked_search().
+        self._doc_lengths = array('I')
+        self._total_length = 0
+        self._cache = None
+        self.set_cache(cache_size)
+        self._filter = None
+        self.set_bloom_filter(bloom_error_rate)
+
+    # Every backing store the WebStore builds, whether in __init__, from a
+    # bulk load or by load(), passes through here; subclasses can wrap it.
+    def _wrap_store(self, store):
+        return store
+
+    @property
+    def cache(self):
+        return self._cache
+
+    # Puts an LRU cache of capacity keyword results in front of search() and
+    # search_many(), or takes it away if capacity is None or 0.  Misses are
+    # cached too.  Indexing a page drops the cached results of its keywords.
+    def set_cache(self, capacity):
+        self._cache = QueryCache(capacity) if capacity else None
+
+    # Keeps a BloomFilter of every stored keyword, with about error_rate
+    # false positives, so that searches for most words that are not in the
+    # index are answered without touching the backing store; None turns it
+    # off.  Built from the store's current keywords, and rebuilt twice the
+    # size whenever it fills up.  Keywords removed by re-indexing stay in
+    # the filter until the next rebuild, which costs nothing but a lookup.
+    def set_bloom_filter(self, error_rate):
+        self._filter = None
+        if error_rate:
+            self._rebuild_filter(WebStore.MIN_FILTER_CAPACITY, error_rate)
+
+    def _rebuild_filter(self, capacity, error_rate):
+        bloom = BloomFilter(max(capacity, 2 * self._store.size), error_rate)
+        self._store.traverse(lambda node: bloom.add(node.data.word))
+        self._filter = bloom
+
+    # Records upper-case keywords that have been added to the backing store.
+    def _added(self, keys):
+        bloom = self._filter
+        if bloom is None:
+            return
+        for key in keys:
+            bloom.add(key)
+        if bloom.full:
+            self._rebuild_filter(2 * bloom.capacity, bloom.error_rate)
+
+    # False only if key is certainly not in the backing store.
+    def _may_hold(self, key):
+        return self._filter is None or key in self._filter
 
-    def __init__(self, ds):
-        self._store = ds()
+    # Drops cached results for the given upper-case keywords.
+    def _invalidate(self, keys):
+        if self._cache is not None:
+            self._cache.invalidate(keys)
 
     # Use link_fisher(), passing the three parameters that were passed to crawl, to capture a list of links.
     # Iterate through the list of links and capture the text on each page.
     # For each word found, either update using the KeywordEntry add() method or create a new KeywordEntry object for that word.
     # Make sure there is only one KeywordEntry object for each word, regardless of how many different pages contain that word.
     # Only store alphabetic words that are four or more letters long.
-    def crawl(self, url: str, depth=0, reg_ex=""):
-        for link in link_fisher(url, depth, reg_ex):
-            for n, word in enumerate(text_harvester(link)):
-                if len(word) < 4 or not word.isalpha():
-                    continue
-                try:
-                    self._store.find(word.upper()).add(link, n)
-                except self._store.NotFoundError:
-                    self._store.insert(KeywordEntry(word, link, n))
+    def crawl(self, url: str, depth=0, reg_ex="", progress=None):
+        for _ in self.crawl_stream(url, depth, reg_ex, progress):
+            pass
 
+    # Streaming form of crawl(): each page is indexed as soon as it has been
+    # fetched, and its url is yielded once its words are searchable, so the
+    # caller can search a partially built index between pages.
+    # progress, if given, is called as progress(url, pages_indexed).
+    def crawl_stream(self, url: str, depth=0, reg_ex="", progress=None):
+        try:
+            for pages_indexed, (link, words, _) in enumerate(
+                    harvest(url, depth, reg_ex, records=self._records,
+                            fetcher=self._fetcher,
+                            parse_workers=self._parse_workers,
+                            parse_batch=self._parse_batch), 1):
+                if self._incremental:
+                    if words is not None:
+                        self._replace_page(link, words)
+                        self._compact_step()
+                else:
+                    self._add_page(link, words)
+                if progress is not None:
+                    progress(link, pages_indexed)
+                yield link
+        finally:
+            self._load_pending()
+
+    def _add_page(self, link, words):
+        length = 0
+        for n, word in enumerate(words):
+            if len(word) < 4 or not word.isalpha():
+                continue
+            length += 1
+            key = word.upper()
+            if self._bulk_load:
+                entry = self._pending.get(key)
+                if entry is not None:
+                    entry.add(link, n)
+                    continue
+            entry = self._store.get(key)
+            if entry is not None:
+                entry.add(link, n)
+            else:
+                entry = KeywordEntry(word, link, n, self._documents)
+                if self._bulk_load:
+                    self._pending[key] = entry
+                else:
+                    self._store.insert(entry)
+                    self._added((key,))
+        if length:
+            doc_id = self._documents.id_of(link)
+            self._set_length(doc_id, self._length(doc_id) + length)
+        if self._cache is not None:
+            self._invalidate({word.upper() for word in words
+                              if len(word) >= 4 and word.isalpha()})
+
+    def _length(self, doc_id):
+        if doc_id < len(self._doc_lengths):
+            return self._doc_lengths[doc_id]
+        return 0
+
+    # Only kept up to date while the lengths cover every document; once they
+    # fall behind (see _update_lengths()) they are left to be rebuilt.
+    def _set_length(self, doc_id, length):
+        lengths = self._doc_lengths
+        if doc_id > len(lengths):
+            return
+        if doc_id == len(lengths):
+            lengths.append(0)
+        self._total_length += length - lengths[doc_id]
+        lengths[doc_id] = length
+
+    def _lengths_current(self):
+        return len(self._doc_lengths) == len(self._documents)
+
+    # Rebuilds the document lengths from the postings if documents were
+    # indexed without them being counted, by a parallel ShardedWebStore
+    # build.  The rebuild counts positions without decoding them, but does
+    # read every postings list.
+    def _update_lengths(self):
+        if not self._lengths_current():
+            lengths = array('I', bytes(4 * len(self._documents)))
+
+            def count(entry):
+                for doc_id, tf in entry.postings.counts():
+                    lengths[doc_id] += tf
+            self._store.traverse(lambda node: count(node.data))
+            for entry in self._pending.values():
+                count(entry)
+            self._doc_lengths = lengths
+            self._total_length = sum(lengths)
+
+    # Indexes link with the given words in place of whatever it held before.
+    # The page's positions are grouped per keyword first, so each entry it
+    # touches is re-encoded once, and keywords that only this page held are
+    # removed from the store.
+    def _replace_page(self, link, words):
+        doc_id = self._documents.intern(link)
+        positions = {}
+        spellings = {}
+        for n, word in enumerate(words):
+            if len(word) < 4 or not word.isalpha():
+                continue
+            key = word.upper()
+            if key not in positions:
+                positions[key] = []
+                spellings[key] = word
+            positions[key].append(n)
+        old_keys = self._page_keys.get(link, ())
+        self._invalidate(old_keys)
+        self._invalidate(positions)
+        for key in old_keys:
+            if key in positions:
+                continue
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._store.find(key)
+            entry.postings.replace(doc_id, [])
+            if not len(entry.postings):
+                if key in self._pending:
+                    del self._pending[key]
+                else:
+                    self._store.remove(key)
+        for key, key_positions in positions.items():
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._store.get(key)
+                if entry is None:
+                    entry = KeywordEntry(spellings[key],
+                                         documents=self._documents)
+                    if self._bulk_load:
+                        self._pending[key] = entry
+                    else:
+                        self._store.insert(entry)
+                        self._added((key,))
+            entry.postings.replace(doc_id, key_positions)
+        self._page_keys[link] = set(positions)
+        self._set_length(doc_id, sum(map(len, positions.values())))
+
+    # A bounded amount of tombstone clearing in the backing store (see
+    # HashQP.compact_step()), for between the pages of a crawl.
+    def _compact_step(self):
+        compact_step = getattr(self._store, "compact_step", None)
+        if compact_step is not None:
+            compact_step()
+
+    def _load_pending(self):
+        if not self._pending:
+            return
+        keys = sorted(self._pending)
+        entries = [self._pending[key] for key in keys]
+        self._pending = {}
+        self._invalidate(keys)
+        from_sorted = getattr(type(self._store), "from_sorted", None)
+        if from_sorted is None:
+            for entry in entries:
+                self._store.insert(entry)
+        else:
+            if self._store.size:
+                existing = []
+                self._store.traverse(lambda node: existing.append(node.data))
+                entries = list(heapq.merge(existing, entries,
+                                           key=lambda entry: entry.word))
+            self._store = self._wrap_store(from_sorted(entries))
+        self._added(keys)
+
+    # Writes the index to path in the format described in index_file.py.
+    # Keywords are written in sorted order, whatever the backing store, and
+    # the document lengths go with them.  An incremental store also writes
+    # its crawl records.
+    def save(self, path):
+        self._load_pending()
+        self._update_lengths()
+        entries = []
+        self._store.traverse(lambda node: entries.append(node.data))
+        entries.sort(key=lambda entry: entry.word)
+        urls = self._documents.urls()
+        records = None
+        if self._records is not None:
+            records = []
+            for url in urls:
+                record = self._records.get(url)
+                records.append(None if record is None else (
+                    record.etag, record.last_modified, record.digest,
+                    record.hrefs))
+        write_index(path, urls,
+                    ((entry.word, entry.postings) for entry in entries),
+                    self._doc_lengths, records)
+
+    # Opens an index written by save().  By default the file is memory-mapped
+    # and searched in place: nothing is decoded until a search needs it, so
+    # opening is cheap whatever the index size, but the store is read-only.
+    # Given a data structure ds, every keyword is read into a new, writable
+    # store of that type instead (with from_sorted() where it has one).
+    # With incremental set, the store re-crawls incrementally from the crawl
+    # records saved with the index (see _restore_crawl()); that needs ds.
+    @classmethod
+    def load(cls, path, ds=None, incremental=False):
+        index = IndexFile(path)
+        if ds is None:
+            if incremental:
+                index.close()
+                raise MappedKeywords.ReadOnlyError(
+                    "A memory-mapped index cannot be re-crawled; load it "
+                    "with a data structure")
+            documents = MappedDocumentTable(index)
+            store = cls(lambda: MappedKeywords(
+                index, lambda word, postings:
+                KeywordEntry.from_postings(word, postings, documents)))
+            store._documents = documents
+            store._load_lengths(index)
+            return store
+        store = cls(ds, incremental=incremental)
+        store._documents = DocumentTable(index.urls())
+        store._load_lengths(index)
+        entries = [KeywordEntry.from_postings(index.term(k), index.postings(k),
+                                              store._documents)
+                   for k in range(index.num_terms)]
+        store._restore_crawl(index, entries)
+        index.close()
+        from_sorted = getattr(ds, "from_sorted", None)
+        if from_sorted is not None:
+            store._store = store._wrap_store(from_sorted(entries))
+        else:
+            for entry in entries:
+                store._store.insert(entry)
+        return store
+
+    # The document lengths saved with the index, so that ranking a loaded
+    # index does not have to read every postings list.
+    def _load_lengths(self, index):
+        self._doc_lengths = index.lengths()
+        self._total_length = sum(self._doc_lengths)
+
+    # Brings back what an incremental store knows about the pages of a
+    # loaded index: the crawl records saved with it, so a re-crawl sends
+    # conditional requests, and each page's keywords, read off the postings,
+    # so re-indexing a page removes the ones it no longer has.  An index
+    # saved without records is re-fetched in full on its first re-crawl.
+    def _restore_crawl(self, index, entries):
+        if not self._incremental:
+            return
+        urls = self._documents.urls()
+        for doc_id, url in enumerate(urls):
+            record = index.record(doc_id)
+            if record is not None:
+                self._records[url] = PageRecord(*record)
+        for entry in entries:
+            for doc_id in entry.postings.doc_ids:
+                self._page_keys.setdefault(urls[doc_id], set()).add(
+                    entry.word)
 
     def crawl_and_list(self, url, depth=0, reg_ex=''):
         word_set = set()
-        for link in link_fisher(url, depth, reg_ex):
-            for word in text_harvester(link):
+        for _, words, _ in harvest(url, depth, reg_ex, fetcher=self._fetcher,
+                                   parse_workers=self._parse_workers,
+                                   parse_batch=self._parse_batch):
+            for word in words:
                 if len(word) < 4 or not word.isalpha():
                     continue
                 word_set.add(word)
@@ -676,83 +463,165 @@ class WebStore(Exception):
     # If you include this return value, you can uncomment the appropriate part of the testing code for some additional valuable metrics.
 
     def search_list(self, kw_list: list):
-        for i in range(len(kw_list)):
-            try:
-                self.search(kw_list[i])
-            except WebStore.NotFoundError:
-                continue
+        _, found, not_found = self.search_many(kw_list)
+        return found, not_found
+
+    # Batched search.  The whole list goes to the backing store's find_many()
+    # in one call, so a miss costs no exception, and the trees answer it with
+    # a single walk.  Returns ({keyword: sites}, found, not_found).
+    # With a cache, only the keywords it does not hold go to find_many().
+    def search_many(self, kw_list: list):
+        cache = self._cache
+        if cache is None:
+            if self._filter is not None:
+                hits = self._store.find_many(
+                    [keyword for keyword in kw_list
+                     if keyword.upper() in self._filter])
+            else:
+                hits = self._store.find_many(kw_list)
+            results = {}
+            found = 0
+            for keyword in kw_list:
+                entry = hits.get(keyword.upper())
+                if entry is None:
+                    continue
+                found += 1
+                results[keyword] = entry.sites
+            return results, found, len(kw_list) - found
+        sites = {}
+        for keyword in kw_list:
+            key = keyword.upper()
+            if key not in sites:
+                sites[key] = cache.get(key)
+        missing = [key for key, value in sites.items()
+                   if value is QueryCache.MISSING]
+        if missing:
+            hits = self._store.find_many(
+                [key for key in missing if self._may_hold(key)])
+            for key in missing:
+                entry = hits.get(key)
+                sites[key] = entry.sites if entry is not None else None
+                cache.put(key, sites[key])
+        results = {}
+        found = 0
+        for keyword in kw_list:
+            value = sites[keyword.upper()]
+            if value is not None:
+                found += 1
+                results[keyword] = list(value)
+        return results, found, len(kw_list) - found
 
     # Okay, we said we wouldn't do search yet, but we do need to make sure things are getting loaded correctly.
     # This method will just be a placeholder, and should return a list (not a KeywordEntry object) of all pages that contain keyword.
     def search(self, keyword: str):
-        try:
-            sitelist = self._store.find(keyword.upper()).sites
-            return sitelist
-        except self._store.NotFoundError:
-            pass
-
-
-def tag_visible(element):
-    if element.parent.name in ['style', 'script', 'head', 'title', 'meta', '[document]']:
-        return False
-    if isinstance(element, Comment):
-        return False
-    return True
-
-
-def words_from_html(body):
-    soup = BeautifulSoup(body, 'html.parser')
-    texts = soup.find_all(string=True)
-    visible_texts = filter(tag_visible, texts)
-    text_string = " ".join(t for t in visible_texts)
-    words = re.findall(r'\w+', text_string)
-    return words
-
-
-rw = RandomWords()
-num_random_words = 5449
-search_trials = 10
-crawl_trials = 1
-structures = [BinarySearchTree, SplayTree, AVLTree, HashQP]
-for depth in range(4):
-    print("Depth = ", depth)
-    stores = [WebStore(ds) for ds in structures]
-    known_words = stores[0].crawl_and_list("http://compsci.mrreed.com", depth)
-    total_words = len(known_words)
-    print(f"{len(known_words)} have been stored in the crawl")
-    if len(known_words) > num_random_words:
-        known_words = random.sample(known_words, num_random_words)
-    num_words = len(known_words)
-    random_words = rw.random_words(count=num_words)
-    known_count = 0
-    for word in random_words:
-        if word in known_words:
-            known_count += 1
-    print(f"{known_count / len(random_words) * 100:.1f}% of random words "
-          f"are in known words")
-    for i, store in enumerate(stores):
-        print("\n\nData Structure:", structures[i])
-        time_s = timeit.timeit(f'store.crawl("http://compsci.mrreed.com", depth)',
-                               setup=f"from __main__ import store, depth",
-                               number=crawl_trials) / crawl_trials
-        print(f"Crawl and Store took {time_s:.2f} seconds")
-        for phase in (random_words, known_words):
-            if phase is random_words:
-                print("Search is random from total pool of random words")
-            else:
-                print("Search only includes words that appear on the site")
-            for divisor in [1, 10, 100]:
-                list_len = max(num_words // divisor, 1)
-                print(f"- Searching for {list_len} words")
-                search_list = random.sample(phase, list_len)
-                store.search_list(search_list)
-                total_time_us = timeit.timeit('store.search_list(search_list)',
-                                              setup="from __main__ import store, search_list",
-                                              number=search_trials)
-                time_us = total_time_us / search_trials / list_len * (10 ** 6)
-                print(f"-- {time_us:5.2f} microseconds per search")
-print(f"{search_trials} search trials and "
-      f"{crawl_trials} crawl trials were conducted")
+        if self._cache is not None:
+            return self._cached_search(keyword.upper())
+        key = keyword.upper()
+        if self._filter is not None and key not in self._filter:
+            return None
+        entry = self._store.get(key)
+        if entry is not None:
+            return entry.sites
+
+    def _cached_search(self, key):
+        sitelist = self._cache.get(key)
+        if sitelist is QueryCache.MISSING:
+            entry = self._store.get(key) if self._may_hold(key) else None
+            sitelist = entry.sites if entry is not None else None
+            self._cache.put(key, sitelist)
+        return list(sitelist) if sitelist is not None else None
+
+    # Up to k stored keywords starting with prefix, in alphabetical order.
+    # The ordered backends walk straight to the first match, O(log n + k);
+    # the hash tables have to look at every entry.
+    def autocomplete(self, prefix: str, k=10) -> list:
+        prefix = prefix.upper()
+        matches = getattr(self._store, "prefix", None)
+        if matches is not None:
+            return [entry.word for entry in islice(matches(prefix), k)]
+        words = []
+        self._store.traverse(lambda node: words.append(node.data.word)
+                             if node.data.word.startswith(prefix) else None)
+        return heapq.nsmallest(k, words)
+
+    # The k pages that best match the words of text, ranked by BM25 (see
+    # ranking.py), as [(url, score)] with the best first.  Any page with at
+    # least one of the words can match; unlike query(), there is no syntax.
+    def ranked_search(self, text: str, k=10) -> list:
+        terms = [word.upper() for word in re.findall(r'\w+', text)
+                 if len(word) >= 4 and word.isalpha()]
+        self._update_lengths()
+        top = BM25(self._postings, self._doc_lengths,
+                   self._total_length).top_k(terms, k)
+        return [(self._documents.url(doc_id), score) for doc_id, score in top]
+
+    def _postings(self, keyword):
+        if not self._may_hold(keyword.upper()):
+            return None
+        entry = self._store.get(keyword)
+        return entry.postings if entry is not None else None
+
+    # Boolean search over the stored word positions.  Adjacent terms are
+    # ANDed; AND, OR, NOT, parentheses and "quoted phrases" are supported, e.g.
+    #     store.query('python (tree OR "hash table") NOT java')
+    def query(self, text: str) -> list:
+        doc_ids = QueryEngine(self._postings, len(self._documents)).run(text)
+        return [self._documents.url(doc_id) for doc_id in doc_ids]
+
+    def search_phrase(self, phrase: str) -> list:
+        doc_ids = QueryEngine(self._postings, len(self._documents)).phrase(phrase)
+        return [self._documents.url(doc_id) for doc_id in doc_ids]
+
+
+if __name__ == "__main__":
+    rw = RandomWords()
+    num_random_words = 5449
+    search_trials = 10
+    crawl_trials = 1
+    structures = [BinarySearchTree, SplayTree, AVLTree, HashQP, CompactHashQP]
+    for depth in range(4):
+        print("Depth = ", depth)
+        stores = [WebStore(ds) for ds in structures]
+        known_words = stores[0].crawl_and_list("http://compsci.mrreed.com", depth)
+        total_words = len(known_words)
+        print(f"{len(known_words)} have been stored in the crawl")
+        if len(known_words) > num_random_words:
+            known_words = random.sample(known_words, num_random_words)
+        num_words = len(known_words)
+        random_words = rw.random_words(count=num_words)
+        known_count = 0
+        for word in random_words:
+            if word in known_words:
+                known_count += 1
+        print(f"{known_count / len(random_words) * 100:.1f}% of random words "
+              f"are in known words")
+        for i, store in enumerate(stores):
+            print("\n\nData Structure:", structures[i])
+            time_s = timeit.timeit(f'store.crawl("http://compsci.mrreed.com", depth)',
+                                   setup=f"from __main__ import store, depth",
+                                   number=crawl_trials) / crawl_trials
+            print(f"Crawl and Store took {time_s:.2f} seconds")
+            for phase in (random_words, known_words):
+                if phase is random_words:
+                    print("Search is random from total pool of random words")
+                else:
+                    print("Search only includes words that appear on the site")
+                for divisor in [1, 10, 100]:
+                    list_len = max(num_words // divisor, 1)
+                    print(f"- Searching for {list_len} words")
+                    search_list = random.sample(phase, list_len)
+                    store.search_list(search_list)
+                    total_time_us = timeit.timeit('store.search_list(search_list)',
+                                                  setup="from __main__ import store, search_list",
+                                                  number=search_trials)
+                    time_us = total_time_us / search_trials / list_len * (10 ** 6)
+                    found, not_found = store.search_list(search_list)
+                    print(f"-- {found} of the words in kw_list were found, out of "
+                          f"{found + not_found} or "
+                          f"{found / (not_found + found) * 100:.0f}%")
+                    print(f"-- {time_us:5.2f} microseconds per search")
+    print(f"{search_trials} search trials and "
+          f"{crawl_trials} crawl trials were conducted")
 
 ### TEST RUN ###
 # Depth =  0
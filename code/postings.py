@@ -0,0 +1,279 @@
+from array import array
+from bisect import bisect_left, insort
+
+
+def encode_varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data):
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+
+def _encode_positions(positions):
+    out = bytearray()
+    previous = 0
+    for position in positions:
+        encode_varint(position - previous, out)
+        previous = position
+    return out
+
+
+def _decode_positions(data):
+    positions = decode_varints(data)
+    for i in range(1, len(positions)):
+        positions[i] += positions[i - 1]
+    return positions
+
+
+def _decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# The bytes of a varint other than its last.
+_CONTINUATION = bytes(range(0x80, 0x100))
+
+
+class DocumentTable:
+    # Interns URLs to small integer document ids, so postings can store an
+    # int per page instead of a reference to the full URL string.
+
+    def __init__(self, urls=()):
+        self._ids = {}
+        self._urls = []
+        for url in urls:
+            self.intern(url)
+
+    def intern(self, url):
+        doc_id = self._ids.get(url)
+        if doc_id is None:
+            doc_id = len(self._urls)
+            self._ids[url] = doc_id
+            self._urls.append(url)
+        return doc_id
+
+    def id_of(self, url):
+        return self._ids.get(url)
+
+    def url(self, doc_id):
+        return self._urls[doc_id]
+
+    def __len__(self):
+        return len(self._urls)
+
+    def urls(self):
+        return list(self._urls)
+
+    def __contains__(self, url):
+        return url in self._ids
+
+
+class PostingsList:
+    # Postings for one keyword.  Document ids are kept sorted in an
+    # array('I'); the positions for every document are delta-encoded as
+    # varints into a single bytearray, with _offsets[i] marking where the
+    # positions of _doc_ids[i] start.  Appending to the last document (the
+    # normal case while a page is being indexed) is O(1); anything else falls
+    # back to re-encoding the one document it touches.
+
+    def __init__(self):
+        self._doc_ids = array('I')
+        self._offsets = array('I')
+        self._positions = bytearray()
+        self._last_position = 0
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    @property
+    def doc_ids(self):
+        return self._doc_ids
+
+    def add(self, doc_id, position):
+        if self._doc_ids and self._doc_ids[-1] == doc_id:
+            if position >= self._last_position:
+                encode_varint(position - self._last_position, self._positions)
+                self._last_position = position
+                return
+        elif not self._doc_ids or self._doc_ids[-1] < doc_id:
+            self._doc_ids.append(doc_id)
+            self._offsets.append(len(self._positions))
+            encode_varint(position, self._positions)
+            self._last_position = position
+            return
+        self._add_out_of_order(doc_id, position)
+
+    def _add_out_of_order(self, doc_id, position):
+        index = self._index(doc_id)
+        if index >= 0:
+            start, end = self._bounds(index)
+            positions = _decode_positions(self._positions[start:end])
+            insort(positions, position)
+        else:
+            index = bisect_left(self._doc_ids, doc_id)
+            start = end = self._offsets[index]
+            positions = [position]
+            self._doc_ids.insert(index, doc_id)
+            self._offsets.insert(index, start)
+        encoded = _encode_positions(positions)
+        self._positions[start:end] = encoded
+        shift = len(encoded) - (end - start)
+        for i in range(index + 1, len(self._offsets)):
+            self._offsets[i] += shift
+        if index == len(self._doc_ids) - 1:
+            self._last_position = positions[-1]
+
+    # Replaces every position of doc_id in one splice, for re-indexing a page
+    # that has changed.  An empty positions list removes the document.
+    def replace(self, doc_id, positions):
+        index = self._index(doc_id)
+        if index >= 0:
+            start, end = self._bounds(index)
+        elif not positions:
+            return
+        else:
+            index = bisect_left(self._doc_ids, doc_id)
+            if index < len(self._offsets):
+                start = end = self._offsets[index]
+            else:
+                start = end = len(self._positions)
+            self._doc_ids.insert(index, doc_id)
+            self._offsets.insert(index, start)
+        encoded = _encode_positions(sorted(positions))
+        self._positions[start:end] = encoded
+        shift = len(encoded) - (end - start)
+        if not positions:
+            del self._doc_ids[index]
+            del self._offsets[index]
+            index -= 1
+        for i in range(index + 1, len(self._offsets)):
+            self._offsets[i] += shift
+        if index >= len(self._doc_ids) - 1:
+            self._last_position = self._decode_last()
+
+    # Appends every document of other, whose doc ids must all come after
+    # this list's, without decoding any positions.
+    def extend(self, other):
+        if not other._doc_ids:
+            return
+        if self._doc_ids and other._doc_ids[0] <= self._doc_ids[-1]:
+            raise ValueError("extend() needs documents after the last one")
+        base = len(self._positions)
+        self._doc_ids.extend(other._doc_ids)
+        self._offsets.extend(offset + base for offset in other._offsets)
+        self._positions += other._positions
+        self._last_position = other._last_position
+
+    def _decode_last(self):
+        if not self._doc_ids:
+            return 0
+        start, end = self._bounds(len(self._doc_ids) - 1)
+        return _decode_positions(self._positions[start:end])[-1]
+
+    def _index(self, doc_id):
+        index = bisect_left(self._doc_ids, doc_id)
+        if index < len(self._doc_ids) and self._doc_ids[index] == doc_id:
+            return index
+        return -1
+
+    def _bounds(self, index):
+        start = self._offsets[index]
+        if index + 1 < len(self._offsets):
+            end = self._offsets[index + 1]
+        else:
+            end = len(self._positions)
+        return start, end
+
+    def positions(self, doc_id):
+        index = self._index(doc_id)
+        if index < 0:
+            return []
+        start, end = self._bounds(index)
+        return _decode_positions(self._positions[start:end])
+
+    # The number of times the keyword occurs in doc_id.  Every varint ends in
+    # a byte with the high bit clear, so this needs no decoding: deleting the
+    # other bytes leaves one byte per position.
+    def count(self, doc_id):
+        index = self._index(doc_id)
+        if index < 0:
+            return 0
+        start, end = self._bounds(index)
+        return len(self._positions[start:end].translate(None, _CONTINUATION))
+
+    # (doc_id, count) for every document, in doc id order.
+    def counts(self):
+        positions = self._positions
+        offsets = self._offsets
+        last = len(offsets) - 1
+        for index, doc_id in enumerate(self._doc_ids):
+            end = offsets[index + 1] if index < last else len(positions)
+            yield doc_id, len(positions[offsets[index]:end].translate(
+                None, _CONTINUATION))
+
+    def items(self):
+        for index, doc_id in enumerate(self._doc_ids):
+            start, end = self._bounds(index)
+            yield doc_id, _decode_positions(self._positions[start:end])
+
+    @property
+    def nbytes(self):
+        return (self._doc_ids.itemsize * len(self._doc_ids)
+                + self._offsets.itemsize * len(self._offsets)
+                + len(self._positions))
+
+    # Serialised form, as stored in an index file: the number of documents,
+    # the doc ids delta-encoded, the byte length of each document's
+    # positions, all as varints, followed by the position bytes unchanged.
+    def to_bytes(self):
+        out = bytearray()
+        encode_varint(len(self._doc_ids), out)
+        previous = 0
+        for doc_id in self._doc_ids:
+            encode_varint(doc_id - previous, out)
+            previous = doc_id
+        for index in range(len(self._doc_ids)):
+            start, end = self._bounds(index)
+            encode_varint(end - start, out)
+        out += self._positions
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        postings = cls()
+        count, pos = _decode_varint(data, 0)
+        doc_id = 0
+        for _ in range(count):
+            delta, pos = _decode_varint(data, pos)
+            doc_id += delta
+            postings._doc_ids.append(doc_id)
+        offset = 0
+        for _ in range(count):
+            postings._offsets.append(offset)
+            length, pos = _decode_varint(data, pos)
+            offset += length
+        postings._positions = bytearray(data[pos:pos + offset])
+        postings._last_position = postings._decode_last()
+        return postings
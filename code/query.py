@@ -0,0 +1,221 @@
+from array import array
+from bisect import bisect_left
+import re
+
+
+class QuerySyntaxError(Exception):
+    pass
+
+
+# Smallest index >= low at which seq[index] >= target.  Galloping doubles the
+# step until it overshoots, then binary searches the last step, so walking
+# through a long list to find a few targets costs O(log gap) per target.
+def gallop(seq, target, low=0):
+    size = len(seq)
+    step = 1
+    while low + step < size and seq[low + step] < target:
+        step *= 2
+    return bisect_left(seq, target, low + step // 2, min(low + step + 1, size))
+
+
+# Below this length ratio a C-level set intersection beats galloping from
+# Python, since galloping only pays off when it can skip long runs of b.
+GALLOP_RATIO = 8
+
+
+def intersect(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) < GALLOP_RATIO * len(a):
+        return array('I', sorted(set(a).intersection(b)))
+    result = array('I')
+    j = 0
+    size = len(b)
+    for doc_id in a:
+        j = gallop(b, doc_id, j)
+        if j == size:
+            break
+        if b[j] == doc_id:
+            result.append(doc_id)
+            j += 1
+    return result
+
+
+def intersect_all(lists):
+    lists = sorted(lists, key=len)
+    if not lists:
+        return array('I')
+    result = lists[0]
+    for doc_ids in lists[1:]:
+        if not result:
+            break
+        result = intersect(result, doc_ids)
+    return result
+
+
+def union(a, b):
+    return array('I', sorted(set(a).union(b)))
+
+
+def difference(a, b):
+    if len(b) < len(a):
+        exclude = set(b)
+        return array('I', (doc_id for doc_id in a if doc_id not in exclude))
+    result = array('I')
+    j = 0
+    size = len(b)
+    for doc_id in a:
+        j = gallop(b, doc_id, j)
+        if j == size or b[j] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+# Words are indexed by their position in the page's full word list, short and
+# non-alphabetic words included, so a phrase keeps the offsets of the words
+# that cannot be looked up ("state of the art" -> STATE at 0, ART at 3) and
+# only constrains the ones that can.
+def phrase_terms(phrase):
+    return [(offset, word.upper())
+            for offset, word in enumerate(re.findall(r'\w+', phrase))
+            if len(word) >= 4 and word.isalpha()]
+
+
+def phrase_match(postings_by_offset):
+    if not postings_by_offset:
+        return array('I')
+    candidates = intersect_all([postings.doc_ids
+                                for _, postings in postings_by_offset])
+    (first_offset, first), rest = postings_by_offset[0], postings_by_offset[1:]
+    result = array('I')
+    for doc_id in candidates:
+        following = [(offset - first_offset, set(postings.positions(doc_id)))
+                     for offset, postings in rest]
+        for position in first.positions(doc_id):
+            if all(position + shift in positions
+                   for shift, positions in following):
+                result.append(doc_id)
+                break
+    return result
+
+
+_TOKEN = re.compile(r'"[^"]*"|\(|\)|[^\s()"]+')
+
+
+def tokenize(text):
+    return _TOKEN.findall(text)
+
+
+class QueryEngine:
+    # Evaluates boolean queries over sorted postings lists.
+    #
+    #   query   := or_expr
+    #   or_expr := and_expr ("OR" and_expr)*
+    #   and_expr := unary (["AND"] unary)*
+    #   unary   := "NOT" unary | "(" or_expr ")" | WORD | "PHRASE"
+    #
+    # Adjacent terms are ANDed.  lookup(word) returns the PostingsList for an
+    # upper-case keyword or None, and num_docs is the size of the document
+    # table, which is what a bare NOT is taken against.
+    #
+    # Words the indexer never stores (shorter than four letters or not
+    # alphabetic) place no constraint on the result, so "hash map" is the
+    # same query as "hash".  The expressions below return None for a part of
+    # the query made only of such words, and it is left out of the AND or OR
+    # around it; a query with nothing else matches no documents.
+
+    def __init__(self, lookup, num_docs):
+        self._lookup = lookup
+        self._num_docs = num_docs
+
+    def run(self, text):
+        self._tokens = tokenize(text)
+        self._pos = 0
+        if not self._tokens:
+            return array('I')
+        result = self._or_expr()
+        if self._pos != len(self._tokens):
+            raise QuerySyntaxError(f"Unexpected {self._tokens[self._pos]!r}")
+        if result is None:
+            return array('I')
+        return result
+
+    def _peek(self):
+        if self._pos < len(self._tokens):
+            return self._tokens[self._pos]
+        return None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise QuerySyntaxError("Unexpected end of query")
+        self._pos += 1
+        return token
+
+    def _or_expr(self):
+        result = self._and_expr()
+        while self._peek() == "OR":
+            self._next()
+            operand = self._and_expr()
+            if result is None:
+                result = operand
+            elif operand is not None:
+                result = union(result, operand)
+        return result
+
+    # Positive operands are intersected smallest first and negated ones are
+    # subtracted afterwards, so "a NOT b" never materialises NOT b.
+    def _and_expr(self):
+        include = []
+        exclude = []
+        while True:
+            negate = False
+            while self._peek() == "NOT":
+                self._next()
+                negate = not negate
+            operand = self._operand()
+            if operand is not None:
+                (exclude if negate else include).append(operand)
+            token = self._peek()
+            if token == "AND":
+                self._next()
+            elif token is None or token in ("OR", ")"):
+                break
+        if include:
+            result = intersect_all(include)
+        elif exclude:
+            result = array('I', range(self._num_docs))
+        else:
+            return None
+        for doc_ids in exclude:
+            if not result:
+                break
+            result = difference(result, doc_ids)
+        return result
+
+    def _operand(self):
+        token = self._next()
+        if token == "(":
+            result = self._or_expr()
+            if self._next() != ")":
+                raise QuerySyntaxError("Expected ')'")
+            return result
+        if token in ("AND", "OR", ")"):
+            raise QuerySyntaxError(f"Unexpected {token!r}")
+        if token.startswith('"'):
+            return self.phrase(token.strip('"'))
+        if len(token) < 4 or not token.isalpha():
+            return None
+        postings = self._lookup(token.upper())
+        if postings is None:
+            return array('I')
+        return postings.doc_ids
+
+    def phrase(self, phrase):
+        postings_by_offset = []
+        for offset, word in phrase_terms(phrase):
+            postings = self._lookup(word)
+            if postings is None:
+                return array('I')
+            postings_by_offset.append((offset, postings))
+        return phrase_match(postings_by_offset)
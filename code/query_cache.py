@@ -0,0 +1,82 @@
+from collections import OrderedDict
+import threading
+
+
+class QueryCache:
+    # Bounded cache of search results, evicting the least recently used
+    # entry once it holds capacity of them.  Keys are normalised queries;
+    # a cached value may be None, so a miss is reported with MISSING.
+    # Counts hits, misses, evictions and invalidations.  Lookups reorder the
+    # entries, so every operation takes a lock and the cache can be shared
+    # between the readers of a ConcurrentWebStore.
+
+    MISSING = object()
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    @property
+    def invalidations(self):
+        return self._invalidations
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key, QueryCache.MISSING)
+            if value is QueryCache.MISSING:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, QueryCache.MISSING) \
+                        is not QueryCache.MISSING:
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def reset_counters(self):
+        with self._lock:
+            self._hits = self._misses = 0
+            self._evictions = self._invalidations = 0
@@ -0,0 +1,50 @@
+import heapq
+import math
+
+
+class BM25:
+    # Okapi BM25 over PostingsLists.  lookup(word) returns the PostingsList
+    # for an upper-case keyword or None, as for QueryEngine; doc_lengths[d]
+    # is the number of indexed words in document d and total_length their
+    # sum, both kept up to date by the index rather than computed here.  A
+    # term's document frequency is the length of its postings list.
+    #
+    #   score(d) = sum over terms t of
+    #       idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl))
+    #   idf(t) = ln(1 + (N - df + .5) / (df + .5))
+
+    DEFAULT_K1 = 1.2
+    DEFAULT_B = .75
+
+    def __init__(self, lookup, doc_lengths, total_length, k1=None, b=None):
+        self._lookup = lookup
+        self._doc_lengths = doc_lengths
+        self._total_length = total_length
+        self._k1 = k1 if k1 is not None else BM25.DEFAULT_K1
+        self._b = b if b is not None else BM25.DEFAULT_B
+
+    # Scores are accumulated term at a time; only the k best documents are
+    # then taken off with a heap, rather than sorting every match.
+    # Returns [(doc_id, score)], best first.
+    def top_k(self, terms, k=10):
+        num_docs = len(self._doc_lengths)
+        if not self._total_length or k <= 0:
+            return []
+        lengths = self._doc_lengths
+        k1 = self._k1
+        # The length normalisation, with avgdl and b folded in.
+        slope = k1 * self._b * num_docs / self._total_length
+        base = k1 * (1 - self._b)
+        scores = {}
+        for term in set(terms):
+            postings = self._lookup(term)
+            if postings is None:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (num_docs - df + .5) / (df + .5))
+            weight = idf * (k1 + 1)
+            get = scores.get
+            for doc_id, tf in postings.counts():
+                scores[doc_id] = get(doc_id, 0) + weight * tf / (
+                    tf + base + slope * lengths[doc_id])
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
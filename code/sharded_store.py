@@ -0,0 +1,269 @@
+import heapq
+import zlib
+
+from main import KeywordEntry, WebStore
+from crawler import harvest, process_pool
+from postings import DocumentTable, PostingsList
+from index_file import IndexFile, MappedDocumentTable, MappedKeywords
+
+
+# The shard a keyword lives in.  CRC-32 rather than hash(), which is salted
+# per process, so a keyword maps to the same shard in every build worker.
+def shard_of(key, shards):
+    return zlib.crc32(key.encode()) % shards
+
+
+class ShardedStore:
+    # Backing store that hash-partitions keywords over a number of instances
+    # of one data structure.  It answers the same find / find_many / insert /
+    # remove / traverse calls as the structures themselves, so a WebStore
+    # can use it in their place.  find_many() splits its keys by shard and
+    # asks each shard once.  If every shard has ordered range() and prefix()
+    # iteration, so does the ShardedStore, merging the shards' walks, and if
+    # every shard has compact_step(), so does the ShardedStore.  options are
+    # passed to ds() for every shard.
+
+    def __init__(self, ds, shards, **options):
+        self._ds = ds
+        self._shards = [ds(**options) for _ in range(shards)]
+        # The shards' own exception, so a miss costs no translation.
+        self.NotFoundError = self._shards[0].NotFoundError
+        if all(hasattr(shard, "range") and hasattr(shard, "prefix")
+               for shard in self._shards):
+            self.range = self._range
+            self.prefix = self._prefix
+        if all(hasattr(shard, "compact_step") for shard in self._shards):
+            self.compact_step = self._compact_step
+
+    @property
+    def shards(self):
+        return self._shards
+
+    @property
+    def size(self):
+        return sum(shard.size for shard in self._shards)
+
+    def _shard(self, key):
+        return self._shards[shard_of(key, len(self._shards))]
+
+    def find(self, key):
+        if type(key) is str:
+            key = key.upper()
+        return self._shard(key).find(key)
+
+    def get(self, key, default=None):
+        if type(key) is str:
+            key = key.upper()
+        return self._shard(key).get(key, default)
+
+    def find_many(self, keys):
+        by_shard = [[] for _ in self._shards]
+        for key in keys:
+            if type(key) is str:
+                key = key.upper()
+            by_shard[shard_of(key, len(self._shards))].append(key)
+        found = {}
+        for shard, shard_keys in zip(self._shards, by_shard):
+            if shard_keys:
+                found.update(shard.find_many(shard_keys))
+        return found
+
+    def __contains__(self, key):
+        if type(key) is str:
+            key = key.upper()
+        return key in self._shard(key)
+
+    def insert(self, data):
+        return self._shard(data.word).insert(data)
+
+    def remove(self, data):
+        key = data if type(data) is str else data.word
+        return self._shard(key).remove(key)
+
+    # Shard by shard, so only sorted within each shard.
+    def traverse(self, function):
+        for shard in self._shards:
+            shard.traverse(function)
+
+    # Each shard's walk is lazy and sorted, so merging them keeps the first k
+    # items at O(shards * log n + k).
+    def _range(self, low=None, high=None):
+        return heapq.merge(*(shard.range(low, high) for shard in self._shards),
+                           key=lambda entry: entry.word)
+
+    def _prefix(self, prefix):
+        return heapq.merge(*(shard.prefix(prefix) for shard in self._shards),
+                           key=lambda entry: entry.word)
+
+    # One step on every shard.
+    def _compact_step(self, max_buckets=None):
+        busy = False
+        for shard in self._shards:
+            busy = shard.compact_step(max_buckets) or busy
+        return busy
+
+    # Adds entries, sorted by word and all for shard index, with
+    # from_sorted() if the shard is still empty and its class has one.
+    def load_shard(self, index, entries):
+        from_sorted = getattr(self._ds, "from_sorted", None)
+        if from_sorted is not None and not self._shards[index].size:
+            self._shards[index] = from_sorted(entries)
+            return
+        for entry in entries:
+            self._shards[index].insert(entry)
+
+
+# Runs in a build worker.  pages is a list of (doc_id, words) with doc ids
+# increasing; returns, for each shard, {keyword: PostingsList.to_bytes()}
+# for the keywords of the pages that belong to it.
+def _index_chunk(pages, shards):
+    postings = [{} for _ in range(shards)]
+    for doc_id, words in pages:
+        for n, word in enumerate(words):
+            if len(word) < 4 or not word.isalpha():
+                continue
+            key = word.upper()
+            shard = postings[shard_of(key, shards)]
+            if key not in shard:
+                shard[key] = PostingsList()
+            shard[key].add(doc_id, n)
+    return [{key: key_postings.to_bytes()
+             for key, key_postings in shard.items()} for shard in postings]
+
+
+class ShardedWebStore(WebStore):
+    # A WebStore whose keywords are spread over shards instances of ds by
+    # ShardedStore.  With processes set, add_pages() (and so crawl()) indexes
+    # pages in that many worker processes: each takes a run of pages and
+    # builds postings for every shard, and the runs are then merged shard by
+    # shard, in document order, without decoding any positions.
+    # Other options are passed on to WebStore.
+
+    DEFAULT_SHARDS = 4
+
+    def __init__(self, ds, shards=None, processes=None, **options):
+        shards = shards if shards else ShardedWebStore.DEFAULT_SHARDS
+        super().__init__(lambda **store_options: ShardedStore(
+            ds, shards, **store_options), **options)
+        self._processes = processes
+
+    @property
+    def shards(self):
+        return self._store.shards
+
+    @property
+    def processes(self):
+        return self._processes
+
+    # Opens an index written by save(), as WebStore.load() does, with its
+    # keywords spread over shards shards by shard_of().  Shard assignment
+    # depends only on the keyword, so any shard count can read any index.
+    # By default every shard is a view of the one memory-mapped file that
+    # sees only its own terms; given ds, each shard is a new ds loaded with
+    # its terms in sorted order.  incremental is as for WebStore.load().
+    @classmethod
+    def load(cls, path, ds=None, shards=None, incremental=False):
+        shards = shards if shards else ShardedWebStore.DEFAULT_SHARDS
+        index = IndexFile(path)
+        if ds is None:
+            if incremental:
+                index.close()
+                raise MappedKeywords.ReadOnlyError(
+                    "A memory-mapped index cannot be re-crawled; load it "
+                    "with a data structure")
+            documents = MappedDocumentTable(index)
+            views = [MappedKeywords(
+                index, lambda word, postings:
+                KeywordEntry.from_postings(word, postings, documents),
+                keep=lambda term, k=k: shard_of(term, shards) == k)
+                for k in range(shards)]
+            # ShardedStore makes its shards by calling ds(); each call here
+            # hands out the next view.
+            store = cls(iter(views).__next__, shards)
+            store._documents = documents
+            store._load_lengths(index)
+            return store
+        store = cls(ds, shards, incremental=incremental)
+        store._documents = DocumentTable(index.urls())
+        store._load_lengths(index)
+        entries = [[] for _ in range(shards)]
+        for k in range(index.num_terms):
+            term = index.term(k)
+            entries[shard_of(term, shards)].append(KeywordEntry.from_postings(
+                term, index.postings(k), store._documents))
+        store._restore_crawl(index, (entry for shard_entries in entries
+                                     for entry in shard_entries))
+        index.close()
+        for k in range(shards):
+            store._store.load_shard(k, entries[k])
+        return store
+
+    # Fetches every page first, then indexes them all with add_pages(), so
+    # no page is searchable until the crawl has finished.
+    def crawl(self, url: str, depth=0, reg_ex="", progress=None):
+        if not self._processes or self._incremental:
+            return super().crawl(url, depth, reg_ex, progress)
+        pages = []
+        for link, words, _ in harvest(url, depth, reg_ex,
+                                      fetcher=self._fetcher,
+                                      parse_workers=self._parse_workers,
+                                      parse_batch=self._parse_batch):
+            pages.append((link, words))
+            if progress is not None:
+                progress(link, len(pages))
+        self.add_pages(pages)
+
+    # pages is a list of (url, words).
+    def add_pages(self, pages):
+        if not self._processes or self._incremental:
+            for link, words in pages:
+                if self._incremental:
+                    self._replace_page(link, words)
+                    self._compact_step()
+                else:
+                    self._add_page(link, words)
+            self._load_pending()
+            return
+        # Only pages new to the index are built in parallel, as their doc
+        # ids come after every existing one and can simply be appended.
+        new_pages = []
+        old_pages = []
+        for link, words in pages:
+            if link in self._documents:
+                old_pages.append((link, words))
+            else:
+                new_pages.append((self._documents.intern(link), words))
+        if new_pages:
+            self._build(new_pages)
+        for link, words in old_pages:
+            self._add_page(link, words)
+        self._load_pending()
+
+    def _build(self, pages):
+        shards = len(self._store.shards)
+        size = -(-len(pages) // self._processes)
+        chunks = [pages[start:start + size]
+                  for start in range(0, len(pages), size)]
+        with process_pool(self._processes) as pool:
+            results = list(pool.map(_index_chunk, chunks,
+                                    [shards] * len(chunks)))
+        for index in range(shards):
+            merged = {}
+            for result in results:
+                for key, data in result[index].items():
+                    key_postings = PostingsList.from_bytes(data)
+                    if key in merged:
+                        merged[key].extend(key_postings)
+                    else:
+                        merged[key] = key_postings
+            entries = []
+            for key in sorted(merged):
+                entry = self._store.shards[index].get(key)
+                if entry is not None:
+                    entry.postings.extend(merged[key])
+                else:
+                    entries.append(KeywordEntry.from_postings(
+                        key, merged[key], self._documents))
+            self._store.load_shard(index, entries)
+            self._invalidate(merged)
+            self._added(entry.word for entry in entries)
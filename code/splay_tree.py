@@ -1,7 +1,11 @@
-from BST import BinarySearchTree, BinaryTreeNode
+from BST import BinarySearchTree, BinaryTreeNode, _MISSING
 
 
 class SplayTree(BinarySearchTree):
+    # find() splays the tree, so a lookup is a write as far as other threads
+    # are concerned.
+    READS_MODIFY = True
+
     def __init__(self):
         super().__init__()
 
@@ -47,20 +51,24 @@ class SplayTree(BinarySearchTree):
         return True
 
     def __contains__(self, data):
-        try:
-            self.find(data)
-            return True
-        except self.NotFoundError:
-            return False
+        return self.get(data, _MISSING) is not _MISSING
 
     def find(self, data):
-        if self._root is None:
+        data = self.get(data, _MISSING)
+        if data is _MISSING:
             raise BinarySearchTree.NotFoundError
+        return data
+
+    # Splays the closest node to the root whether or not data is found.
+    def get(self, data, default=None):
+        if self._root is None:
+            return default
+        if type(data) is str:
+            data = data.upper()
         self._root = self._splay(data)
         if self._root.data != data:
-            raise BinarySearchTree.NotFoundError
-        else:
-            return self._root.data
+            return default
+        return self._root.data
 
     def show_root(self):
         if self._root is not None:
@@ -0,0 +1,63 @@
+import math
+import random
+
+from AVL_tree import AVLTree
+
+
+# Checks every node's stored height and balance and returns the keys in
+# order.  Heights come from an explicit post-order walk.
+def _check(tree):
+    heights = {None: -1}
+    items = []
+    stack = [(tree._root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if node is None:
+            continue
+        if not children_done:
+            stack.append((node, True))
+            stack.append((node.left_child, False))
+            stack.append((node.right_child, False))
+            continue
+        left = heights[node.left_child]
+        right = heights[node.right_child]
+        assert abs(left - right) <= 1
+        assert node.height == max(left, right) + 1
+        heights[node] = node.height
+    tree.traverse(lambda node: items.append(node.data))
+    assert items == sorted(items)
+    if tree.size:
+        assert tree._root.height <= 1.45 * math.log2(tree.size + 2)
+    return items
+
+
+def test_random_inserts_and_removes_keep_the_tree_balanced():
+    rng = random.Random(0)
+    tree = AVLTree()
+    expected = set()
+    for _ in range(20):
+        for key in rng.sample(range(5000), 300):
+            assert tree.insert(key) == (key not in expected)
+            expected.add(key)
+        assert _check(tree) == sorted(expected)
+        for key in rng.sample(sorted(expected), 200):
+            tree.remove(key)
+            expected.discard(key)
+        assert tree.size == len(expected)
+        assert _check(tree) == sorted(expected)
+
+
+def test_sorted_inserts_and_removes_stay_balanced():
+    size = 20000
+    tree = AVLTree()
+    for key in range(size):
+        tree.insert(key)
+    assert _check(tree) == list(range(size))
+    for key in range(0, size, 3):
+        tree.remove(key)
+    assert _check(tree) == [key for key in range(size) if key % 3]
+    for key in range(size - 1, -1, -1):
+        if key % 3:
+            tree.remove(key)
+    assert tree.size == 0
+    assert tree._root is None
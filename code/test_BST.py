@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from BST import BinarySearchTree
+
+
+def _in_order(tree):
+    items = []
+    tree.traverse(lambda node: items.append(node.data))
+    return items
+
+
+def test_random_inserts_and_removes_keep_the_tree_ordered():
+    rng = random.Random(0)
+    tree = BinarySearchTree()
+    expected = set()
+    for _ in range(20):
+        for key in rng.sample(range(5000), 300):
+            assert tree.insert(key) == (key not in expected)
+            expected.add(key)
+        for key in rng.sample(sorted(expected), 150):
+            tree.remove(key)
+            expected.discard(key)
+        assert tree.size == len(expected)
+        assert _in_order(tree) == sorted(expected)
+    for key in rng.sample(range(5000), 200):
+        assert (key in tree) == (key in expected)
+    with pytest.raises(BinarySearchTree.NotFoundError):
+        tree.remove(-1)
+
+
+# Sorted input makes the tree a single chain, far deeper than the recursion
+# limit the recursive insert and remove used to hit.
+def test_sorted_inserts_deeper_than_the_recursion_limit():
+    size = 5000
+    tree = BinarySearchTree()
+    for key in range(size):
+        assert tree.insert(key)
+    assert not tree.insert(size - 1)
+    assert tree.size == size
+    assert _in_order(tree) == list(range(size))
+    assert tree.find(size - 1) == size - 1
+    assert tree.find_max() == size - 1
+    for key in range(0, size, 2):
+        tree.remove(key)
+    for key in range(size - 1, 0, -2):
+        tree.remove(key)
+    assert tree.size == 0
+    assert _in_order(tree) == []
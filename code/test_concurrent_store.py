@@ -0,0 +1,86 @@
+import threading
+from array import array
+
+from AVL_tree import AVLTree
+from concurrent_store import ConcurrentWebStore, SnapshotStore
+from splay_tree import SplayTree
+
+PAGES = [("http://example.com/1", "splay trees rotate every lookup".split()),
+         ("http://example.com/2", "readers share the lookup lock".split())]
+
+
+def _build(store):
+    for url, words in PAGES:
+        store._add_page(url, words)
+    store._load_pending()
+    return store
+
+
+def test_reloaded_splay_tree_is_read_through_a_snapshot(tmp_path):
+    path = str(tmp_path / "index.wsix")
+    _build(ConcurrentWebStore(SplayTree)).save(path)
+    store = ConcurrentWebStore.load(path, SplayTree)
+    assert type(store._store) is SnapshotStore
+    assert store.search("lookup") == ["http://example.com/1",
+                                      "http://example.com/2"]
+    assert type(ConcurrentWebStore.load(path, AVLTree)._store) is AVLTree
+    bulk = _build(ConcurrentWebStore(SplayTree, bulk_load=True))
+    assert type(bulk._store) is SnapshotStore
+
+
+def test_concurrent_searches_on_a_reloaded_splay_tree(tmp_path):
+    path = str(tmp_path / "index.wsix")
+    _build(ConcurrentWebStore(SplayTree)).save(path)
+    store = ConcurrentWebStore.load(path, SplayTree)
+    expected = {word: store.search(word)
+                for _, words in PAGES for word in words}
+    errors = []
+
+    def reader():
+        for _ in range(200):
+            for word, sites in expected.items():
+                if store.search(word) != sites:
+                    errors.append(word)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def _blocks_while_reading(store, function):
+    with store.lock.read():
+        thread = threading.Thread(target=function)
+        thread.start()
+        thread.join(0.2)
+        blocked = thread.is_alive()
+    thread.join()
+    return blocked
+
+
+def test_set_cache_takes_the_write_lock():
+    store = _build(ConcurrentWebStore(AVLTree))
+    assert _blocks_while_reading(store, lambda: store.set_cache(16))
+    assert store.cache is not None
+    assert store.search("lookup") == store.search("LOOKUP")
+
+
+def test_ranked_search_rebuilds_lengths_under_the_write_lock(tmp_path):
+    path = str(tmp_path / "index.wsix")
+    original = _build(ConcurrentWebStore(AVLTree))
+    original.save(path)
+    expected = original.ranked_search("lookup lock")
+    store = ConcurrentWebStore.load(path, AVLTree)
+    assert store._lengths_current()
+    assert store._doc_lengths == original._doc_lengths
+    # As they would be had the lengths never been counted.
+    store._doc_lengths = array('I')
+    results = []
+    assert _blocks_while_reading(
+        store, lambda: results.append(store.ranked_search("lookup lock")))
+    assert store._lengths_current()
+    assert results == [expected]
+    store._add_page("http://example.com/3", "lookup".split())
+    assert store._lengths_current()
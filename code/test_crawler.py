@@ -0,0 +1,181 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from AVL_tree import AVLTree
+from crawler import parse_page
+from fetcher import Fetcher
+from hash_table import HashQP
+from index_file import MappedKeywords
+from main import WebStore
+from sharded_store import ShardedWebStore
+
+PAGES = {
+    "/index.html": '<html><body>alpha bravo <a href="a.html">a</a></body>'
+                   '</html>',
+    "/a.html": '<html><body>apple banana <a href="b.html">b</a></body>'
+               '</html>',
+    "/b.html": '<html><body>cherry delta</body></html>',
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    failing = set()
+    gone = {}
+    # Paths requested with If-None-Match.
+    conditional = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if "If-None-Match" in self.headers:
+            self.conditional.append(self.path)
+        headers = {}
+        if self.path in self.failing:
+            body = b"<html><body>service unavailable</body></html>"
+            status = 503
+        elif self.path in self.gone:
+            body = b"<html><body>page not found</body></html>"
+            status = self.gone[self.path]
+        elif self.path in PAGES:
+            body = PAGES[self.path].encode()
+            headers["ETag"] = '"%s"' % hashlib.sha1(body).hexdigest()
+            status = 200
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                body = b""
+                status = 304
+        else:
+            body = b""
+            status = 404
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@contextmanager
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with Fetcher(retries=0) as fetcher:
+            yield f"http://127.0.0.1:{server.server_port}", fetcher
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_incremental_recrawl_keeps_pages_that_return_errors(monkeypatch):
+    with _serve() as (base, fetcher):
+        store = WebStore(HashQP, incremental=True, fetcher=fetcher)
+        store.crawl(base + "/index.html", 2)
+        record = store._records[base + "/a.html"]
+        assert store.search("apple") == [base + "/a.html"]
+        monkeypatch.setattr(_Handler, "failing", {"/a.html"})
+        store.crawl(base + "/index.html", 2)
+        assert store.search("apple") == [base + "/a.html"]
+        assert store.search("service") is None
+        assert store._records[base + "/a.html"] is record
+        # The failed page's links are still followed.
+        assert store.search("cherry") == [base + "/b.html"]
+
+
+@pytest.mark.parametrize("status", [404, 410])
+def test_incremental_recrawl_removes_pages_that_are_gone(monkeypatch,
+                                                         status):
+    with _serve() as (base, fetcher):
+        store = WebStore(HashQP, incremental=True, fetcher=fetcher)
+        store.crawl(base + "/index.html", 2)
+        monkeypatch.setattr(_Handler, "gone", {"/a.html": status})
+        store.crawl(base + "/index.html", 2)
+        assert store.search("apple") is None
+        assert store.search("banana") is None
+        assert store.search("found") is None
+        assert base + "/a.html" not in store._records
+        assert store.search("alpha") == [base + "/index.html"]
+        # Once it is back it is fetched and indexed in full.
+        monkeypatch.setattr(_Handler, "gone", {})
+        store.crawl(base + "/index.html", 2)
+        assert store.search("apple") == [base + "/a.html"]
+
+
+@pytest.mark.parametrize("load", [WebStore.load, ShardedWebStore.load])
+def test_crawl_records_survive_save_and_load(monkeypatch, tmp_path, load):
+    path = str(tmp_path / "index.wsix")
+    with _serve() as (base, fetcher):
+        store = WebStore(HashQP, incremental=True, fetcher=fetcher)
+        store.crawl(base + "/index.html", 2)
+        store.save(path)
+        with pytest.raises(MappedKeywords.ReadOnlyError):
+            load(path, incremental=True)
+        assert load(path, AVLTree)._records is None
+        loaded = load(path, AVLTree, incremental=True)
+        assert {url: (record.etag, record.last_modified, record.digest,
+                      record.hrefs)
+                for url, record in loaded._records.items()} == \
+            {url: (record.etag, record.last_modified, record.digest,
+                   record.hrefs)
+             for url, record in store._records.items()}
+        loaded._fetcher = fetcher
+        monkeypatch.setattr(_Handler, "conditional", [])
+        monkeypatch.setitem(PAGES, "/a.html",
+                            '<html><body>apple grape <a href="b.html">b</a>'
+                            '</body></html>')
+        loaded.crawl(base + "/index.html", 2)
+        assert sorted(_Handler.conditional) == \
+            ["/a.html", "/b.html", "/index.html"]
+        assert loaded.search("banana") is None
+        assert loaded.search("grape") == [base + "/a.html"]
+        assert loaded.search("apple") == [base + "/a.html"]
+        assert loaded.search("cherry") == [base + "/b.html"]
+
+
+TRICKY_PAGES = [
+    # Script and style text is not visible, nor is the head.
+    "<html><head><title>Title words</title><style>body { color: red }"
+    "</style></head><body>visible <script>var hidden = 1;</script>text"
+    "</body></html>",
+    # Entities, named, numeric and unknown, joined to the text around them.
+    "<p>caf&eacute; na&#239;ve &#x4E2D;&#25991; fish&amp;chips &bogus; "
+    "&lt;tag&gt; AT&T &copy</p>",
+    # Comments end a string; declarations and CDATA are strings of their own.
+    "<!DOCTYPE html><p>before<!-- hidden comment -->after"
+    "<![CDATA[cdata words]]><?php processing ?></p>",
+    # Unclosed and stray tags.
+    "<div><p>first paragraph<p>second <b>bold <i>both</b> italic"
+    "</i></span> tail<li>item one<li>item two</div>trailing",
+    "<p>line<br>break<img src=x>image <br/>done</br>after",
+    '<a href="one.html">link <a href=two.html>nested</a> <a>no href</a>'
+    '<a href>empty</a><script><a href="in-script.html">x</a></script>',
+]
+
+ENCODED_PAGES = [
+    ('<html><head><meta charset="iso-8859-1"></head><body>'
+     'garçon naïve</body></html>'.encode("iso-8859-1"), ["garçon", "naïve"]),
+    ('<html><head><meta http-equiv="Content-Type" content="text/html; '
+     'charset=windows-1251"></head><body>привет '
+     'мир</body></html>'.encode("windows-1251"), ["привет", "мир"]),
+    ('<p>utf8 über straße</p>'.encode(), ["utf8", "über", "straße"]),
+]
+
+
+@pytest.mark.parametrize("body", TRICKY_PAGES + [body for body, _ in
+                                                  ENCODED_PAGES])
+def test_stream_tokenizer_matches_soup(body):
+    soup = parse_page(body, "soup")
+    assert parse_page(body, "stream") == soup
+    assert soup[0]
+    assert parse_page(body, "stream", with_words=False) == \
+        parse_page(body, "soup", with_words=False)
+
+
+@pytest.mark.parametrize("body, words", ENCODED_PAGES)
+def test_stream_tokenizer_decodes_the_declared_charset(body, words):
+    assert parse_page(body, "stream")[0] == words
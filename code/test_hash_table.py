@@ -0,0 +1,160 @@
+import random
+
+import main
+from hash_table import CompactHashQP, HashEntry, HashQP, fnv1a_hash
+from main import KeywordEntry, WebStore
+
+
+def _words(rng, count):
+    return ["".join(rng.choices("abcdefghijklmnop", k=8))
+            for _ in range(count)]
+
+
+# Mean number of buckets probed to find each live entry of a table that is
+# not part way through a rebuild.
+def _mean_probes(table):
+    buckets = table._buckets
+    size = len(buckets)
+    total = 0
+    for entry in buckets:
+        if entry._state != HashEntry.State.ACTIVE:
+            continue
+        bucket = entry._hash % size
+        kth_odd_number = 1
+        probes = 1
+        while buckets[bucket] is not entry:
+            bucket += kth_odd_number
+            kth_odd_number += 2
+            probes += 1
+            if bucket >= size:
+                bucket -= size
+        total += probes
+    return total / table.size
+
+
+def test_compact_step_bounds_tombstones_under_churn():
+    rng = random.Random(0)
+    table = HashQP(incremental_compaction=True)
+    live = {}
+    for word in _words(rng, 2000):
+        entry = KeywordEntry(word)
+        if table.insert(entry):
+            live[entry.word] = entry
+    for _ in range(20):
+        for key in rng.sample(sorted(live), 500):
+            assert table.remove(key)
+            del live[key]
+            table.compact_step()
+        for word in _words(rng, 500):
+            entry = KeywordEntry(word)
+            if table.insert(entry):
+                live[entry.word] = entry
+            table.compact_step()
+        while table.compact_step():
+            pass
+        assert table.tombstones <= table.size
+        assert _mean_probes(table) < 2
+    assert table.size == len(live)
+    for key, entry in live.items():
+        assert table.find(key) is entry
+
+
+def test_incremental_crawls_compact_the_backing_store(monkeypatch):
+    rng = random.Random(1)
+    store = WebStore(HashQP, incremental=True,
+                     store_options={"incremental_compaction": True})
+    table = store._store
+    assert table._incremental_compaction
+    links = [f"http://example.com/{page}" for page in range(50)]
+    steps = []
+
+    def compact_step():
+        steps.append(table.tombstones)
+        return HashQP.compact_step(table)
+    monkeypatch.setattr(table, "compact_step", compact_step)
+    for _ in range(30):
+        pages = [(link, _words(rng, 30), []) for link in links]
+        monkeypatch.setattr(main, "harvest", lambda *args, **kwargs:
+                            iter(pages))
+        store.crawl(links[0])
+        if table._old_buckets is None:
+            assert table.tombstones <= table.size
+            assert _mean_probes(table) < 2
+    assert len(steps) == 30 * len(links)
+    for link, words, _ in pages:
+        for word in words:
+            assert link in store.search(word)
+    assert table.size == len({word.upper() for _, words, _ in pages
+                              for word in words})
+
+
+def test_compact_table_has_the_hash_table_attributes():
+    rng = random.Random(2)
+    words = _words(rng, 1000)
+    tables = (HashQP(hash_function="fnv1a"),
+              CompactHashQP(hash_function="fnv1a"))
+    for table in tables:
+        assert table.sites is None
+        assert table.hash_function is fnv1a_hash
+        table.max_lambda = .4
+        table.min_lambda = .1
+        for word in words:
+            table.insert(KeywordEntry(word))
+        for word in words[::2]:
+            table.remove(word.upper())
+    hashed, compact = tables
+    assert compact.max_lambda == hashed.max_lambda == .4
+    assert compact.min_lambda == hashed.min_lambda == .1
+    assert compact.size == hashed.size
+    assert compact.tombstones == hashed.tombstones
+    assert not compact.compact_step()
+    compact.compact()
+    assert compact.tombstones == 0
+    for word in words:
+        assert (word.upper() in compact) == (word.upper() in hashed)
+
+
+def _contents(table):
+    entries = []
+    table.traverse(lambda entry: entries.append(entry.data))
+    return entries
+
+
+# Growing and then shrinking an incrementally rehashed table, checking the
+# whole table against a dict after every operation made while a rebuild is
+# half done.
+def test_operations_during_an_incremental_resize():
+    rng = random.Random(3)
+    table = HashQP(incremental_rehash=True)
+    expected = {}
+    checked = 0
+    words = _words(rng, 6000)
+    operations = [("insert", word) for word in words[:4000]]
+    for word in words[4000:]:
+        operations.append(("insert", word))
+        operations.append(("remove", rng.choice(words[:4000])))
+    operations += [("remove", word) for word in words]
+    for operation, word in operations:
+        key = word.upper()
+        if operation == "insert":
+            entry = KeywordEntry(word)
+            assert table.insert(entry) == (key not in expected)
+            expected.setdefault(key, entry)
+        else:
+            assert table.remove(key) == (key in expected)
+            expected.pop(key, None)
+        if table._old_buckets is None:
+            continue
+        checked += 1
+        if checked % 50:
+            assert table.get(key) is expected.get(key)
+            continue
+        assert table.size == len(expected)
+        for other, entry in expected.items():
+            assert table.find(other) is entry
+        assert sorted(entry.word for entry in _contents(table)) == \
+            sorted(expected)
+        assert table.find_many(list(expected) + ["MISSING"]) == expected
+    assert checked > 100
+    assert table.size == 0
+    assert table._table_size < 1000
@@ -0,0 +1,44 @@
+from main import KeywordEntry, WebStore
+from AVL_tree import AVLTree
+from BST import BinarySearchTree
+from index_file import MappedKeywords
+
+
+def test_entries_without_a_table_do_not_share_doc_ids():
+    first = KeywordEntry("python", "http://one", 0)
+    second = KeywordEntry("python", "http://two", 3)
+    assert first.sites == ["http://one"]
+    assert second.sites == ["http://two"]
+    assert first.get_locations("http://two") == []
+    assert second.get_locations("http://two") == [3]
+    assert KeywordEntry("empty").sites == []
+    assert not hasattr(KeywordEntry, "documents")
+
+
+def test_stores_keep_their_own_document_tables():
+    first = WebStore(BinarySearchTree)
+    second = WebStore(BinarySearchTree)
+    first._add_page("http://one", ["python"])
+    second._add_page("http://two", ["python"])
+    assert first.search("python") == ["http://one"]
+    assert second.search("python") == ["http://two"]
+    assert len(first._documents) == len(second._documents) == 1
+
+
+def test_loaded_indexes_rank_without_reading_every_postings_list(
+        tmp_path, monkeypatch):
+    store = WebStore(BinarySearchTree)
+    store._add_page("http://one", "ranking needs document lengths".split())
+    store._add_page("http://two", "lengths lengths everywhere".split())
+    path = str(tmp_path / "index.wsix")
+    store.save(path)
+    expected = store.ranked_search("lengths ranking")
+
+    def traverse(self, function):
+        raise AssertionError("every postings list was read")
+    monkeypatch.setattr(MappedKeywords, "traverse", traverse)
+    monkeypatch.setattr(BinarySearchTree, "traverse", traverse)
+    for loaded in (WebStore.load(path), WebStore.load(path, AVLTree)):
+        assert loaded._doc_lengths == store._doc_lengths
+        assert loaded._total_length == store._total_length
+        assert loaded.ranked_search("lengths ranking") == expected
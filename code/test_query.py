@@ -0,0 +1,28 @@
+from main import WebStore
+from hash_table import HashQP
+
+
+def _store():
+    store = WebStore(HashQP)
+    store._add_page("http://a", "a hash map of the table".split())
+    store._add_page("http://b", "the hash tree and 42 leaves".split())
+    store._add_page("http://c", "leaves of a tree".split())
+    return store
+
+
+def test_unindexable_words_do_not_empty_the_result():
+    store = _store()
+    assert store.query("hash map") == ["http://a", "http://b"]
+    assert store.query("the hash") == store.query("hash")
+    assert store.query("hash AND 42") == store.query("hash")
+    assert store.query("hash NOT the") == store.query("hash")
+    assert store.query("tree (of OR a)") == ["http://b", "http://c"]
+    assert store.query("leaves OR table") == ["http://a", "http://b",
+                                           "http://c"]
+
+
+def test_query_of_only_unindexable_words_matches_nothing():
+    store = _store()
+    assert store.query("the") == []
+    assert store.query("a OR of") == []
+    assert store.query("NOT tree") == ["http://a"]
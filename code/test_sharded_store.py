@@ -0,0 +1,73 @@
+import random
+
+from AVL_tree import AVLTree
+from hash_table import HashQP
+from main import WebStore
+from sharded_store import ShardedWebStore
+
+
+def _pages(count=40, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices("abcdefgh", k=rng.randint(4, 7)))
+                  for _ in range(300)]
+    return [(f"http://example.com/{page}", rng.choices(vocabulary, k=30))
+            for page in range(count)]
+
+
+def _build(store, pages):
+    for url, words in pages:
+        store._add_page(url, words)
+    store._load_pending()
+    return store
+
+
+def test_ordered_shards_merge_range_and_prefix():
+    pages = _pages()
+    sharded = _build(ShardedWebStore(AVLTree), pages)
+    plain = _build(WebStore(AVLTree), pages)
+    assert hasattr(sharded._store, "prefix")
+    for prefix in ("", "a", "ab", "hh", "zz"):
+        assert sharded.autocomplete(prefix, 15) == \
+            plain.autocomplete(prefix, 15)
+    words = [entry.word for entry in sharded._store.range("B", "D")]
+    assert words == [entry.word for entry in plain._store.range("B", "D")]
+
+
+def test_hash_shards_fall_back_to_traverse():
+    pages = _pages()
+    sharded = _build(ShardedWebStore(HashQP), pages)
+    assert not hasattr(sharded._store, "prefix")
+    assert sharded.autocomplete("ab", 5) == \
+        _build(WebStore(AVLTree), pages).autocomplete("ab", 5)
+
+
+def _contents(store):
+    entries = []
+    store._store.traverse(lambda node: entries.append(
+        (node.data.word, node.data.sites)))
+    return sorted(entries)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    pages = _pages()
+    store = _build(ShardedWebStore(AVLTree), pages)
+    path = str(tmp_path / "index.wsix")
+    store.save(path)
+    expected = _contents(store)
+    for loaded in (ShardedWebStore.load(path, AVLTree),
+                   ShardedWebStore.load(path, AVLTree, shards=3),
+                   ShardedWebStore.load(path),
+                   ShardedWebStore.load(path, shards=3)):
+        assert len(loaded.shards) in (3, ShardedWebStore.DEFAULT_SHARDS)
+        assert _contents(loaded) == expected
+        assert loaded._store.size == len(expected)
+        for word, sites in expected[:20]:
+            assert loaded.search(word) == sites
+        assert loaded.search("zzzz") is None
+        assert loaded.autocomplete("a", 10) == store.autocomplete("a", 10)
+        assert loaded.query(f"{expected[0][0]} OR {expected[1][0]}") == \
+            store.query(f"{expected[0][0]} OR {expected[1][0]}")
+    reloaded = ShardedWebStore.load(path, AVLTree)
+    assert all(type(shard) is AVLTree for shard in reloaded.shards)
+    reloaded._add_page("http://example.com/new", ["zzzz"])
+    assert reloaded.search("zzzz") == ["http://example.com/new"]
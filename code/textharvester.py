@@ -1,4 +1,3 @@
-from bs4 import BeautifulSoup
 import timeit
 import random
 from random_words import RandomWords
@@ -6,46 +5,7 @@ from BST import BinarySearchTree
 from hash_table import HashQP
 from splay_tree import SplayTree
 from AVL_tree import AVLTree
-import requests
-import re
-from bs4.element import Comment
-from urllib.parse import urljoin
-
-def text_harvester(url):
-    headers = {
-        'User-Agent': ''}
-    try:
-        page = requests.get(url, headers=headers)
-    except:
-        return []
-    res = words_from_html(page.content)
-
-    return res
-
-def link_fisher(url, depth=0, reg_ex=""):
-    res = _link_fisher(url, depth, reg_ex)
-    res.append(url)
-    return list(set(res))
-
-
-def _link_fisher(url, depth, reg_ex):
-    link_list = []
-    if depth == 0:
-        return link_list
-    headers = {
-        'User-Agent': ''}
-    try:
-        page = requests.get(url, headers=headers)
-    except:
-        print("Cannot retrieve", url)
-        return link_list
-    data = page.text
-    soup = BeautifulSoup(data, features="html.parser")
-    for link in soup.find_all('a', attrs={'href': re.compile(reg_ex)}):
-        link_list.append(urljoin(url, link.get('href')))
-    for i in range(len(link_list)):
-        link_list.extend(_link_fisher(link_list[i], depth - 1, reg_ex))
-    return link_list
+from crawler import harvest, text_harvester, words_from_html
 
 
 class WebStore(Exception):
@@ -62,8 +22,8 @@ class WebStore(Exception):
     # Only store alphabetic words that are four or more letters long.
     def crawl(self, url: str, depth=0, reg_ex=""):
         kws = []
-        for link in link_fisher(url, depth, reg_ex):
-            for n, word in enumerate(text_harvester(link)):
+        for link, words, _ in harvest(url, depth, reg_ex):
+            for n, word in enumerate(words):
                 if len(word) < 4 or not word.isalpha():
                     continue
                 else:
@@ -78,8 +38,8 @@ class WebStore(Exception):
 
     def crawl_and_list(self, url, depth=0, reg_ex=''):
         word_set = set()
-        for link in link_fisher(url, depth, reg_ex):
-            for word in text_harvester(link):
+        for _, words, _ in harvest(url, depth, reg_ex):
+            for word in words:
                 if len(word) < 4 or not word.isalpha():
                     continue
                 word_set.add(word)
@@ -111,23 +71,6 @@ class WebStore(Exception):
 
 
 
-def tag_visible(element):
-    if element.parent.name in ['style', 'script', 'head', 'title', 'meta', '[document]']:
-        return False
-    if isinstance(element, Comment):
-        return False
-    return True
-
-
-def words_from_html(body):
-    soup = BeautifulSoup(body, 'html.parser')
-    texts = soup.find_all(string=True)
-    visible_texts = filter(tag_visible, texts)
-    text_string = " ".join(t for t in visible_texts)
-    words = re.findall(r'\w+', text_string)
-    return words
-
-
 class KeywordEntry:
 
     def __init__(self, word: str, url: str = None, location: int = None):